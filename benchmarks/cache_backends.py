@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+#Measures load and save time of every cache backend against the number of cached files
+#Usage: python3 benchmarks/cache_backends.py [file counts...]
+import os
+import sys
+import time
+import tempfile
+sys.path.insert(0, os.path.join(os.path.split(os.path.realpath(__file__))[0], ".."))
+from c_cache import *
+
+#Builds a cache dictionary looking like one of a project with n source files, each including 10 of n/4 headers
+def synthetic_cache(n):
+    cache = {"HASHES": {"/src/project": "6b4ff9ef80d531fd75ab1cf5defb048311c4533c"}, "MOC_REALPATHS": []}
+    headers = ["/src/project/include/module"+str(i % 50)+"/header"+str(i)+".h" for i in range(max(n//4, 10))]
+    for h in headers:
+        cache[h] = {"T": 1792320758.9957027}
+    for i in range(n):
+        incs = [headers[(i*7+j) % len(headers)] for j in range(10)]
+        cache["/src/project/module"+str(i % 50)+"/file"+str(i)+".cpp"] = {"T": 1792320758.9957027, "I": incs, "S": " -I /src/project/include/"}
+    cache["NEEDED_SRC_FILES_SUBCACHE"] = {h: False for h in headers}
+    cache["SUBPROJ"] = {}
+    cache["LINKERSCRIPT_TO_USE"] = {"/src/project": "N"}
+    return cache
+
+def bench(backend, n):
+    cache = synthetic_cache(n)
+    with tempfile.TemporaryDirectory() as d:
+        t = time.perf_counter()
+        save_cache(cache_backends[backend](d), cache)
+        t_save = time.perf_counter()-t
+
+        t = time.perf_counter()
+        store, loaded = open_cache(d, backend)
+        t_load = time.perf_counter()-t
+
+        #A no-op run: the cache is loaded, one entry changes and it is written back
+        loaded[next(iter(k for k in loaded if k.endswith(".cpp")))]["T"] += 1
+        t = time.perf_counter()
+        save_cache(store, loaded)
+        t_resave = time.perf_counter()-t
+        size = os.path.getsize(store.path)
+    return t_save, t_load, t_resave, size
+
+counts = [int(x) for x in sys.argv[1:]] or [1000, 10000, 50000]
+print("%-8s %8s %10s %10s %10s %10s" % ("backend", "files", "save [s]", "load [s]", "resave [s]", "size [kB]"))
+for n in counts:
+    for backend in cache_backends:
+        t_save, t_load, t_resave, size = bench(backend, n)
+        print("%-8s %8d %10.3f %10.3f %10.3f %10d" % (backend, n, t_save, t_load, t_resave, size//1024))
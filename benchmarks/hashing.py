@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+#Compares the original hash_file (SHA-1, read 1 KB at a time) with fast_hash_file on files from 1 KB to 100 MB,
+#and hashing many small files one after another with hash_files on a thread pool
+#Usage: python3 benchmarks/hashing.py [threads]
+import os
+import sys
+import time
+import hashlib
+import tempfile
+sys.path.insert(0, os.path.join(os.path.split(os.path.realpath(__file__))[0], ".."))
+from c_util import fast_hash_file, hash_files, xxhash
+import c_util
+c_util.wait_paused = True #no progress animation between the results
+
+threads = int(sys.argv[1]) if len(sys.argv) > 1 else (os.cpu_count() or 1)
+
+#hash_file as it was before, for comparison
+def hash_file_1k(filename):
+    h = hashlib.sha1()
+    with open(filename,'rb') as file:
+        chunk = 0
+        while chunk != b'':
+            chunk = file.read(1024)
+            h.update(chunk)
+    return h.hexdigest()
+
+#runs f(arg) until at least 0.2 s have passed, returns the mean time per call
+def timeit(f, arg):
+    n = 0
+    t = time.perf_counter()
+    while n == 0 or time.perf_counter()-t < 0.2:
+        f(arg)
+        n += 1
+    return (time.perf_counter()-t)/n
+
+print("fast_hash_file uses", "xxhash" if xxhash else "blake2b (pip install xxhash for a faster digest)")
+print("%-8s %14s %14s %8s" % ("size", "sha1 1KB [ms]", "fast [ms]", "speedup"))
+with tempfile.TemporaryDirectory() as d:
+    for size, label in [(1 << 10, "1 KB"), (1 << 20, "1 MB"), (10 << 20, "10 MB"), (100 << 20, "100 MB")]:
+        path = os.path.join(d, label.replace(" ", ""))
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        t_old = timeit(hash_file_1k, path)
+        t_new = timeit(fast_hash_file, path)
+        print("%-8s %14.3f %14.3f %7.1fx" % (label, t_old*1e3, t_new*1e3, t_old/t_new))
+        os.unlink(path)
+
+    #A source tree: 2000 files of 20 KB
+    files = []
+    for i in range(2000):
+        files.append(os.path.join(d, "f"+str(i)+".cpp"))
+        with open(files[-1], "wb") as f:
+            f.write(os.urandom(20 << 10))
+    t = time.perf_counter()
+    for f in files:
+        hash_file_1k(f)
+    t_old = time.perf_counter()-t
+    t = time.perf_counter()
+    hash_files(files, threads)
+    t_new = time.perf_counter()-t
+    print("2000 files of 20 KB: sha1 1KB serial %.3f s, hash_files on %d threads %.3f s" % (t_old, threads, t_new))
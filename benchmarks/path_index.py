@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+#Compares looking up the files an #include statement may refer to via regex scans over every known file (as comp4me did)
+#with the filename index of IndexedPathSet
+#Usage: python3 benchmarks/path_index.py [number of files] [number of lookups]
+import os
+import sys
+import time
+import random
+sys.path.insert(0, os.path.join(os.path.split(os.path.realpath(__file__))[0], ".."))
+from c_util import get_files_regex, IndexedPathSet
+import c_util
+c_util.wait_paused = True #no progress animation between the results
+
+n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+n_lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+random.seed(0)
+paths = [os.path.join(os.path.sep+"src", "module"+str(i % 200), "sub"+str(i % 7), "file"+str(i)+(".h" if i % 2 else ".cpp")) for i in range(n_files)]
+lookups = [os.path.join("sub"+str(i % 7), "file"+str(i)+".h") for i in random.sample(range(1, n_files, 2), n_lookups)]
+
+t = time.perf_counter()
+index = IndexedPathSet(paths)
+t_build = time.perf_counter()-t
+
+t = time.perf_counter()
+scan_results = []
+for l in lookups:
+    filesearch = get_files_regex(l)
+    scan_results.append([p for p in paths if filesearch.findall(p)])
+t_scan = time.perf_counter()-t
+
+t = time.perf_counter()
+index_results = []
+for l in lookups:
+    filesearch = get_files_regex(l)
+    index_results.append([p for p in index.paths_named(l) if filesearch.findall(p)])
+t_index = time.perf_counter()-t
+
+assert scan_results == index_results
+print(n_files, "files,", n_lookups, "lookups")
+print("regex scan:   %8.3f s  (%.1f us per lookup)" % (t_scan, t_scan/n_lookups*1e6))
+print("filename index: %6.3f s  (%.1f us per lookup, %.3f s to build the index)" % (t_index, t_index/n_lookups*1e6, t_build))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+#Compares the lists comp4me used for the entry/exclude folders and the checked header files with PathSet
+#Replays what a search does with them: a membership test for every folder walked and every include found,
+#adding the ones not seen yet, and removing some again
+#Usage: python3 benchmarks/path_set.py [number of folders] [number of includes]
+import os
+import sys
+import time
+import random
+sys.path.insert(0, os.path.join(os.path.split(os.path.realpath(__file__))[0], ".."))
+from c_util import PathSet
+import c_util
+c_util.wait_paused = True #no progress animation between the results
+
+n_dirs = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+n_includes = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+random.seed(0)
+dirs = [os.path.join(os.path.sep+"src", "module"+str(i % 200), "sub"+str(i)) for i in range(n_dirs)]
+headers = [os.path.join(dirs[i % n_dirs], "file"+str(i)+".h") for i in range(n_includes // 10)]
+includes = [random.choice(headers) for _ in range(n_includes)]
+removed = random.sample(dirs, n_dirs // 10)
+
+def replay(make):
+    t = time.perf_counter()
+    entries = make()
+    for d in dirs: #folders found while walking
+        if d not in entries:
+            entries.append(d)
+    for d in removed: #e.g. folders given with -e
+        if d in entries:
+            entries.remove(d)
+    checked = make()
+    new = 0
+    for h in includes:
+        if h not in checked:
+            checked.append(h)
+            new += 1
+    return time.perf_counter()-t, list(entries), new
+
+t_list, entries_list, new_list = replay(list)
+t_set, entries_set, new_set = replay(PathSet)
+
+assert entries_list == entries_set and new_list == new_set
+print(n_dirs, "folders,", n_includes, "includes of", len(headers), "headers")
+print("list:    %8.3f s" % t_list)
+print("PathSet: %8.3f s" % t_set)
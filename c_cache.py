@@ -0,0 +1,114 @@
+import os #Access to Filesystem
+import json
+import pickle
+import sqlite3
+import toml #TOML File Format, presence is checked by c_util
+
+#Every backend stores the whole cache dictionary, as used by comp4me, in a file in the build directory.
+#They all share the same interface: load() returns the dictionary, save(dictionary) writes it back
+
+#The original, human readable format. Slow to parse and write for big projects
+class TomlCache:
+    file_name = "comp_cache"
+
+    def __init__(self, build_dir):
+        self.path = os.path.join(build_dir, self.file_name)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> dict:
+        return toml.load(self.path)
+
+    def save(self, cache):
+        with open(self.path+".tmp", "w") as f:
+            toml.dump(cache, f)
+        os.replace(self.path+".tmp", self.path)
+
+#One pickled dictionary, fastest to load and save as a whole
+class PickleCache:
+    file_name = "comp_cache.pickle"
+
+    def __init__(self, build_dir):
+        self.path = os.path.join(build_dir, self.file_name)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> dict:
+        with open(self.path, "rb") as f:
+            return pickle.load(f)
+
+    def save(self, cache):
+        with open(self.path+".tmp", "wb") as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(self.path+".tmp", self.path)
+
+#One row per top-level key, the value being JSON. Only rows that changed since loading are written back
+class SqliteCache:
+    file_name = "comp_cache.sqlite"
+
+    def __init__(self, build_dir):
+        self.path = os.path.join(build_dir, self.file_name)
+        self.loaded_rows = {} #{key : json string} as read from the database, used to only write changed rows
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def connect(self):
+        con = sqlite3.connect(self.path)
+        con.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        return con
+
+    def load(self) -> dict:
+        con = self.connect()
+        self.loaded_rows = dict(con.execute("SELECT key, value FROM cache"))
+        con.close()
+        return {k: json.loads(v) for k, v in self.loaded_rows.items()}
+
+    def save(self, cache):
+        #sets (MOC_REALPATHS) are stored as lists
+        rows = {k: json.dumps(v, default=list) for k, v in cache.items()}
+        changed = [(k, v) for k, v in rows.items() if self.loaded_rows.get(k) != v]
+        removed = [(k,) for k in self.loaded_rows if k not in rows]
+        con = self.connect()
+        with con:
+            con.executemany("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", changed)
+            con.executemany("DELETE FROM cache WHERE key = ?", removed)
+        con.close()
+        self.loaded_rows = rows
+
+cache_backends = {"sqlite": SqliteCache, "pickle": PickleCache, "toml": TomlCache}
+
+#returns the dictionary stored by the backend store, or None if it can't be read (damaged, or written in a shape the format can't read back)
+#An unreadable cache is treated like a missing one, everything is searched and compiled anew
+def try_load(store):
+    try:
+        return store.load()
+    except (ValueError, EOFError, pickle.UnpicklingError, sqlite3.DatabaseError):
+        return None
+
+#Loads the cache stored in build_dir with the given backend
+#If there is none, but one written by another backend (e.g. an old TOML cache), that one is loaded and migrated on the next save
+def open_cache(build_dir, backend):
+    store = cache_backends[backend](build_dir)
+    if store.exists():
+        return store, try_load(store) or {}
+    for b in cache_backends.values():
+        old = b(build_dir)
+        if b != cache_backends[backend] and old.exists():
+            return store, try_load(old) or {}
+    return store, {}
+
+#Writes the cache, and removes the files of all other backends so an outdated one is never migrated later
+def save_cache(store, cache):
+    store.save(cache)
+    build_dir = os.path.split(store.path)[0]
+    for b in cache_backends.values():
+        if b != type(store) and os.path.exists(os.path.join(build_dir, b.file_name)):
+            os.unlink(os.path.join(build_dir, b.file_name))
+
+def delete_cache(build_dir):
+    for b in cache_backends.values():
+        if os.path.exists(os.path.join(build_dir, b.file_name)):
+            os.unlink(os.path.join(build_dir, b.file_name))
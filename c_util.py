@@ -2,13 +2,21 @@ import os #Access to Filesystem
 import re   #Regex
 import subprocess   #Sys commands
 import hashlib
+import mmap
+import shlex
+import shutil
+import stat
 import time
-from threading import Thread
+import heapq
+import json
+from contextlib import contextmanager
+from threading import Thread, Condition, Lock, get_ident
 
 #region--------------PRINTING TOOLS---------------
 
 #Thread that runs a little animation to indicate the programm working
 wait_paused = False
+print_lock = Lock() #held while printing from multiple threads, so the animation and outputs of parallel jobs don't mix
 def wait_anim():
     global wait_paused 
     wait_index = 0
@@ -34,7 +42,8 @@ def wait_anim():
         if wait_paused:
             time.sleep(1)
             continue
-        print(animation[wait_index % len(animation)], end="\r")
+        with print_lock:
+            print(animation[wait_index % len(animation)], end="\r", flush=True)
         time.sleep(.1)
         wait_index += 1
 
@@ -49,12 +58,47 @@ def xinput(*txt):
     inputt = input(*txt)
     wait_paused = False
     return inputt
+
+#Prints all lines at once, without output of other threads or the animation in between
+#Prints nothing if all of them are empty, e.g. a compiler that had nothing to say
+def print_block(*lines):
+    lines = [l.rstrip("\n") for l in lines if l and l.strip()]
+    if not lines:
+        return
+    with print_lock:
+        print("          ", end="\r")
+        print("\n".join(lines), flush=True)
+
+#Runs a command of a build job with its output captured, so it can be printed in one block when it is done
+#cmd is a list of arguments, no shell is involved. stdout and stderr are merged to keep the order of the messages
+#Returns the subprocess.CompletedProcess, with returncode 127 if the program doesn't exist
+def run_captured(cmd):
+    try:
+        return subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace")
+    except OSError as e:
+        return subprocess.CompletedProcess(cmd, 127, str(e)+"\n")
+
+#Matches what a shell would expand in flags: $(...), ${...}, $VARIABLE and `...`
+shell_expansion_match = re.compile(r"\$[({\w]|`")
+
+#Turns flags as written in the config files into a list of arguments. Each of `parts` may be a string
+#holding multiple arguments (split like a shell would), or a list of such strings
+def split_args(*parts):
+    result = []
+    for p in parts:
+        if type(p) == str:
+            result.extend(shlex.split(p))
+        else:
+            for x in p:
+                result.extend(shlex.split(x))
+    return result
 #endregion
 
 top_level_dir = os.getcwd()
 error_match = re.compile(r"fatal error: \\?\"?'?([_a-zA-Z0-9\./-]+)")
 comp_reg = re.compile(r".*comp.toml\s*$")
-include_match = re.compile(r"^[\s]*#include[^\S\r\n]*[\"<]([^\s\"\>]*)[\">]")
+include_match = re.compile(r"^[\s]*#include[^\S\r\n]*([\"<])([^\s\"\>]*)[\">]")
+system_include_match = re.compile(r"^[\s]*#include[^\S\r\n]*<([^\s>]*)>")
 #In case the path-seperator is an escape character, double it up (Windows..)
 reg_pathsep_t = os.path.sep
 reg_pathsep = ""
@@ -80,6 +124,14 @@ class color:
 error_string = color.RED+color.BOLD+"ERROR: "+color.END
 warning_string = color.YELLOW+color.BOLD+"WARNING: "+color.END
 interaction_required_string = color.CYAN+color.BOLD+"USER NEEDED: "+color.END
+try:
+    import xxhash #Optional, faster hashing of file contents
+except Exception:
+    xxhash = None
+try:
+    import inotify_simple #Optional, lets --watch sleep until something changes instead of polling
+except Exception:
+    inotify_simple = None
 try: 
     import toml #TOML File Format
 except Exception:
@@ -96,7 +148,7 @@ def read_definitions(filepath):
         return {}
     return tmp_definitions
 
-known_definitions = ["INHERIT", "EXCLUDE_SRC","ENTRYPOINT","NEUTRALS","EXCLUDES", "HEADER","C","CPP", "CCOMP", "CFLAGS", "CPPCOMP","CPPFLAGS","LINKER", "LINKERFLAGS","AR", "AS_LIB", "GENERATE_EXECUTABLE", "GENERATE_TEST", "EXCLUDED_FILES", "PROPAGATE", "NEXT_CONFIG", "QT5_MAKE", "ONLY_LINK_WITH_DIRECT_PARENT"]
+known_definitions = ["INHERIT", "EXCLUDE_SRC","ENTRYPOINT","NEUTRALS","EXCLUDES", "HEADER","C","CPP", "CCOMP", "CFLAGS", "CPPCOMP","CPPFLAGS","LINKER", "LINKERFLAGS","AR", "AS_LIB", "GENERATE_EXECUTABLE", "GENERATE_TEST", "EXCLUDED_FILES", "PROPAGATE", "NEXT_CONFIG", "QT5_MAKE", "ONLY_LINK_WITH_DIRECT_PARENT", "UNITY", "UNITY_SIZE"]
 def check_for_unknown_definitions(definitions, end = False):
     for d in definitions:
         if d not in known_definitions:
@@ -117,22 +169,143 @@ def abspath_to_relpath(f, nm):
 def rel_to_top(f):
     return os.path.relpath(f, top_level_dir)
 
+#returns the arguments that add the include directories `paths`
+def include_args(paths):
+    result = []
+    for p in paths:
+        result.extend(["-I", p])
+    return result
+
+#Runs the command c without any output, returns its return code. Like a shell, 127 means the program wasn't found
 def silent_cmd(c):
-    p = subprocess.Popen(c, shell=True, stdout=subprocess.DEVNULL,stderr=subprocess.STDOUT)
-    return p
+    try:
+        return subprocess.run(split_args(c), stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+    except FileNotFoundError:
+        return 127
+    except OSError:
+        return 126
 
 def call_version(c):
-    v1 = silent_cmd(c+ " -v")
-    v2 = silent_cmd(c+ " -V")
-    v1.wait()
-    v2.wait()
-    return {v1.returncode, v2.returncode}
+    return {silent_cmd(c+ " -v"), silent_cmd(c+ " -V")}
+
+#Results of check_presence, stored in the cache: {tool : {"P": path it resolved to, "M": modification date of that file, "R": result}}
+#A result is only reused while the tool still resolves to the same, unchanged file
+tool_probes = {}
+tool_probes_this_run = {} #{tool : result} of the tools already checked in this run
 
+#Returns True if the tool t is NOT present, by calling it with -v and -V
 def check_presence(t):
-    return not any(element not in {127,1} for element in call_version(t))
+    if t in tool_probes_this_run:
+        return tool_probes_this_run[t]
+    argv = split_args(t)
+    path = shutil.which(argv[0]) if argv else None
+    mtime = os.path.getmtime(path) if path else None
+    cached = tool_probes.get(t)
+    if cached and cached.get("P") == path and cached.get("M") == mtime:
+        result = cached["R"]
+    else:
+        result = not any(element not in {127,1} for element in call_version(t))
+        tool_probes[t] = {"P": path, "M": mtime, "R": result}
+    tool_probes_this_run[t] = result
+    return result
+
+#Name a path is indexed by in a PathIndex
+def index_key(path):
+    return os.path.basename(os.path.normcase(path))
+
+#Keeps track of paths by their file name, so all paths ending in a given name can be found without looking at all of them
+class PathIndex:
+    def __init__(self):
+        self.by_name = {} #{filename : {path : None}}, dicts instead of sets to keep the order paths were added in
+
+    def index_path(self, path):
+        self.by_name.setdefault(index_key(path), {})[path] = None
+
+    def unindex_path(self, path):
+        paths = self.by_name.get(index_key(path))
+        if paths is not None:
+            paths.pop(path, None)
+            if not paths:
+                del self.by_name[index_key(path)]
+
+    #returns all paths whose filename equals the filename of `name`, which may also be a relative path
+    def paths_named(self, name):
+        return list(self.by_name.get(index_key(name), ()))
+
+#Ordered set of paths, usable like a list (append, extend, remove) or like a set (add, discard)
+#Membership tests, adding and removing take constant time instead of scanning a list
+class PathSet:
+    def __init__(self, paths = ()):
+        self.paths = {} #{path : None}, a dict instead of a set to keep the order paths were added in
+        self.extend(paths)
+
+    def add(self, path):
+        self.paths[path] = None
+    append = add
 
-#searches for a file with name `filename` in a given list
+    def extend(self, paths):
+        for p in paths:
+            self.add(p)
+
+    def remove(self, path):
+        del self.paths[path]
+
+    def discard(self, path):
+        if path in self.paths:
+            self.remove(path)
+
+    def clear(self):
+        for p in list(self.paths):
+            self.remove(p)
+
+    def __contains__(self, path):
+        return path in self.paths
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+#PathSet that is also indexed by filename
+class IndexedPathSet(PathSet, PathIndex):
+    def __init__(self, paths = ()):
+        PathIndex.__init__(self)
+        PathSet.__init__(self, paths)
+
+    def add(self, path):
+        if path not in self.paths:
+            self.paths[path] = None
+            self.index_path(path)
+    append = add
+
+    def remove(self, path):
+        del self.paths[path]
+        self.unindex_path(path)
+
+#dict of {path : anything} that is indexed by filename
+class IndexedFileDict(dict, PathIndex):
+    def __init__(self):
+        dict.__init__(self)
+        PathIndex.__init__(self)
+
+    def __setitem__(self, path, value):
+        dict.__setitem__(self, path, value)
+        self.index_path(path)
+
+    def __delitem__(self, path):
+        dict.__delitem__(self, path)
+        self.unindex_path(path)
+
+    def pop(self, path, *default):
+        if path in self:
+            self.unindex_path(path)
+        return dict.pop(self, path, *default)
+
+#searches for a file with name `filename` in a given list, or PathIndex
 def find_file_locations(filename, place):
+    if isinstance(place, PathIndex):
+        return [os.path.split(f)[0] for f in place.paths_named(filename) if f.endswith(os.path.sep+filename) or f == filename]
     result = []
     for f in place:
         if str(f).endswith(os.path.sep+filename) or str(f) == filename:    
@@ -140,28 +313,130 @@ def find_file_locations(filename, place):
     return result
 
 
-#This may be cached
-#reads `file`, scans each line with a regex matching #include statements, returns all matches if the are also found in `known_includes`
+#reads `file`, scans each line with a regex matching #include statements, returns (name, quoted) of all included files
+#quoted is True for #include "name", False for #include <name>
+#This is cached, since files are included by many others
 read_files_cache = {}
-def check_include_duality(file, known_includes):
-    i_s = [] #list of names by which the included files are called in this file
-    statements = []
-    if file in read_files_cache:
-        statements = read_files_cache[file]
-    else:
+def read_includes_with_kind(file):
+    if file not in read_files_cache:
+        statements = []
         with open(file, "r") as f:
             lines = f.readlines()
             for l in lines:
-                statements.extend(include_match.findall(l))
+                statements.extend((name, delim == '"') for delim, name in include_match.findall(l))
         read_files_cache[file] = statements
+    return read_files_cache[file]
+
+#returns the names of all files `file` includes
+def read_include_statements(file):
+    return [name for name, quoted in read_includes_with_kind(file)]
+
+#returns if the file at path is missing or doesn't contain exactly `content`, used to only write generated files when they change
+def content_differs(path, content) -> bool:
+    if not os.path.exists(path):
+        return True
+    with open(path, "r") as f:
+        return f.read() != content
+
+#returns the names of the files `file` includes with angle brackets, in order
+def read_system_includes(file):
+    with open(file, "r") as f:
+        return [m for l in f for m in system_include_match.findall(l)]
+
+#returns the names of the static functions/variables `file` declares (found by lines starting with `static`, also indented ones)
+#Two files declaring the same one can't be compiled as one unity batch
+static_definition_match = re.compile(r"^\s*static\s+[^(=;{]*?\b(\w+)\s*(?:\(|=|;|\[|\{)")
+def file_scope_symbols(file):
+    symbols = set()
+    with open(file, "r", errors="replace") as f:
+        for l in f:
+            symbols.update(static_definition_match.findall(l))
+    return symbols
+
+#returns why `file` has to be compiled on its own instead of in a unity batch, or None if it doesn't
+#Anonymous namespaces, using-directives and macros it defines or undefines would apply to the files after it in the batch
+#This looks at its lines, it doesn't parse it: these are also found in comments, but not if they are written across lines
+anonymous_namespace_match = re.compile(r"\bnamespace\s*\{")
+using_namespace_match = re.compile(r"^\s*using\s+namespace\b")
+ifndef_match = re.compile(r"^\s*#\s*(?:ifndef\s+(\w+)|if\s+!\s*defined\s*\(?\s*(\w+))")
+define_undef_match = re.compile(r"^\s*#\s*(define|undef)\s+(\w+)")
+def unity_unsafe_reason(file):
+    guard = None #the macro of an include guard, defining that is fine
+    last_ifndef = None
+    with open(file, "r", errors="replace") as f:
+        for l in f:
+            if anonymous_namespace_match.search(l):
+                return "it has an anonymous namespace"
+            if using_namespace_match.match(l):
+                return "it has a using namespace directive"
+            m = ifndef_match.match(l)
+            if m:
+                last_ifndef = m.group(1) or m.group(2)
+                continue
+            m = define_undef_match.match(l)
+            if m:
+                if guard is None and m.group(1) == "define" and m.group(2) == last_ifndef:
+                    guard = last_ifndef
+                elif m.group(2) != guard:
+                    return "it "+m.group(1)+"s the macro "+m.group(2)
+            if l.strip():
+                last_ifndef = None
+    return None
 
-    for incl in statements:
+#returns all include statements of `file` that match one of `known_includes`
+def check_include_duality(file, known_includes):
+    i_s = [] #list of names by which the included files are called in this file
+    for incl in read_include_statements(file):
         for ki in known_includes:
             if ki.endswith(os.path.sep+incl):
                 i_s.append(incl)
                 break
     return i_s
 
+#returns the path of the first directory in `dirs` that contains the file `name`, or False
+def find_in_dirs(name, dirs):
+    for d in dirs:
+        p = os.path.join(d, name)
+        if os.path.isfile(p):
+            return p
+    return False
+
+#Splits a make rule, as written by the preprocessor with -MM, into its words
+#Continued lines are joined, and spaces escaped with a backslash (in paths) don't split words
+def split_make_rule(rule):
+    rule = rule.replace("\\\n", " ")
+    return [re.sub(r"\\([ #])", r"\1", w) for w in re.findall(r"(?:\\ |[^\s])+", rule)]
+
+#returns the directories given via -I in a list of arguments
+def include_dirs_of_flags(flags):
+    dirs = []
+    for i in range(len(flags)):
+        if flags[i] == "-I" and i+1 < len(flags):
+            dirs.append(flags[i+1])
+        elif flags[i].startswith("-I") and len(flags[i]) > 2:
+            dirs.append(flags[i][2:])
+    return dirs
+
+#returns the directories the compiler `comp` searches for include files by default (system headers)
+#Asks the compiler once per compiler/flags/language combination
+compiler_include_dirs_cache = {}
+def compiler_include_dirs(comp, flags, is_c):
+    key = (tuple(comp), tuple(flags), is_c)
+    if key not in compiler_include_dirs_cache:
+        cmd = comp + ["-x", "c" if is_c else "c++", "-E", "-v", "-"] + flags
+        output = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, text=True)
+        dirs = []
+        in_list = False
+        for l in output.stderr.splitlines():
+            if l.startswith("#include") and "search starts here" in l:
+                in_list = True
+            elif l.startswith("End of search list"):
+                in_list = False
+            elif in_list:
+                dirs.append(l.strip().replace(" (framework directory)", ""))
+        compiler_include_dirs_cache[key] = dirs
+    return compiler_include_dirs_cache[key]
+
 #returns the dir a path is located in, or False if in none
 def is_path_in_any_dir(path, lib_dirs):
     candidate_libs = []
@@ -173,39 +448,42 @@ def is_path_in_any_dir(path, lib_dirs):
         return os.path.split(l)[1]
     return False
 
-def qt5_make(root, header_fileendings, path_change):
+#`tree` is the TreeSnapshot to read `root` from, it is updated with the generated files
+#returns [(generated file, command)] of the uic and moc outputs that were outdated. With dry_run, they aren't generated
+def qt5_make(root, header_fileendings, path_change, tree, dry_run = False):
     def mocname(f):
         return root+os.path.sep+"moc_"+os.path.splitext(f)[0]+".cpp"
     
     def uicname(f):
         return root+os.path.sep+"ui_"+os.path.splitext(f)[0]+".h"
 
-    process = silent_cmd("uic -v")
-    process.wait()
-    if process.returncode == 127:
-        print(error_string+"Couldn't find uic")
-        exit()
-    process = silent_cmd("moc -v")
-    process.wait()
-    if process.returncode == 127:
-        print(error_string+"Couldn't find moc")
-        exit()
-    for f in os.listdir(root):
+    if not dry_run:
+        if silent_cmd("uic -v") == 127:
+            print(error_string+"Couldn't find uic")
+            exit()
+        if silent_cmd("moc -v") == 127:
+            print(error_string+"Couldn't find moc")
+            exit()
+    stale = []
+    for f in tree.listdir(root):
         fp = os.path.join(root, f)
-        modtime = os.path.getmtime(fp)
+        modtime = tree.getmtime(fp)
         if path_change:
             modtime = time.time()
-        if os.path.isfile(fp):
+        if tree.isfile(fp):
             if f.endswith(".ui"):
                 uicn = uicname(f)
-                if not os.path.exists(uicn) or os.path.getmtime(uicn) < modtime:
-                    cmd = "uic "+ fp +" > " + uicname(f)
-                    subprocess.run(cmd, shell=True)
+                if not tree.entry(uicn) or tree.getmtime(uicn) < modtime:
+                    stale.append((uicn, ["uic", fp, "-o", uicn]))
             elif os.path.splitext(f)[1] in header_fileendings and not f.startswith("ui_"):
                 mocn = mocname(f)
-                if not os.path.exists(mocn) or os.path.getmtime(mocn) < modtime:
-                    cmd = "moc "+ fp +" > " + mocname(f)
-                    subprocess.run(cmd, shell=True)
+                if not tree.entry(mocn) or tree.getmtime(mocn) < modtime:
+                    stale.append((mocn, ["moc", fp, "-o", mocn]))
+    if not dry_run:
+        for out, cmd in stale:
+            subprocess.run(cmd, stdin=subprocess.DEVNULL)
+        tree.invalidate(root)
+    return stale
 
 #https://www.programiz.com/python-programming/examples/hash-file (MIT-license)
 def hash_file(filename):
@@ -221,23 +499,390 @@ def hash_file(filename):
        # loop till the end of the file
        chunk = 0
        while chunk != b'':
-           # read only 1024 bytes at a time
-           chunk = file.read(1024)
+           # read hash_block_size bytes at a time
+           chunk = file.read(hash_block_size)
            h.update(chunk)
 
    # return the hex representation of digest
    return h.hexdigest()
 
+hash_block_size = 1 << 20 #Files are read in blocks of this size when hashing, bigger ones are mapped into memory by fast_hash_file
+
+#returns a digest of the file's content, prefixed by the algorithm used. Uses xxhash if it is installed, blake2b otherwise
+#Not suitable for anything security related, only for detecting changes
+def fast_hash_file(filename):
+    if xxhash:
+        h = xxhash.xxh3_128()
+        prefix = "xxh3:"
+    else:
+        h = hashlib.blake2b(digest_size=20)
+        prefix = "b2:"
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size > hash_block_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                h.update(m)
+        else:
+            h.update(f.read())
+    return prefix+h.hexdigest()
+
+#returns {filename : digest} for all files, hashed with fast_hash_file on `threads` threads
+#Files that can't be read (e.g. removed in the meantime) are left out
+def hash_files(filenames, threads):
+    results = {}
+    def hash_one(f):
+        try:
+            results[f] = fast_hash_file(f)
+        except OSError:
+            pass
+    jobs = JobServer(threads)
+    for f in filenames:
+        jobs.add(lambda f=f: hash_one(f))
+    jobs.run()
+    return results
+
 #Returns wether or not a file path is relevant, used to ignore hidden folders/build folder
 def is_irrelevant(p) -> bool:
     return os.path.sep+"." in p or "build" in p.split(os.path.sep)
 
-#Return the list l split into n chunks, ensuring that no element is listed twice, or is left out
-def chunks(l, n):
-    res = []
-    for i in range(0, n):
-        res.append(l[i::n])
-    return res
+#Which headers every file includes, and the reverse: which files include every header
+#Built from the "I" lists of the cache, so finding everything a changed header affects doesn't need to look at every file
+class DependencyGraph:
+    def __init__(self):
+        self.includes = {} #{file : list of headers it includes}
+        self.included_by = {} #{header : set of files that include it}
+
+    def set_includes(self, path, headers):
+        for h in self.includes.get(path, ()):
+            if h in self.included_by:
+                self.included_by[h].discard(path)
+        self.includes[path] = list(headers)
+        for h in headers:
+            self.included_by.setdefault(h, set()).add(path)
+
+    #returns every file that is in the graph, as includer or included
+    def nodes(self):
+        return set(self.includes) | set(self.included_by)
+
+    #returns `paths` and every file that includes one of them, directly or via other headers
+    def with_dependents(self, paths):
+        result = set(paths)
+        stack = list(result)
+        while stack:
+            for d in self.included_by.get(stack.pop(), ()):
+                if d not in result:
+                    result.add(d)
+                    stack.append(d)
+        return result
+
+#Listing of the directory tree, read with os.scandir. Every directory is only read once and its entries are kept,
+#including the stat info os.scandir caches for them. Irrelevant directories (hidden ones and build) are not read
+class TreeSnapshot:
+    def __init__(self):
+        self.listings = {} #{path of directory : ({subdir name : DirEntry}, {file name : DirEntry})}
+
+    def read_dir(self, path):
+        if path not in self.listings:
+            dirs = {}
+            files = {}
+            try:
+                with os.scandir(path) as it:
+                    for e in it:
+                        try:
+                            if e.is_dir():
+                                dirs[e.name] = e
+                            else:
+                                files[e.name] = e
+                        except OSError:
+                            pass
+            except OSError:
+                pass
+            self.listings[path] = (dirs, files)
+        return self.listings[path]
+
+    #Forget the listing of a directory, e.g. because files were generated in it
+    def invalidate(self, path):
+        self.listings.pop(path, None)
+
+    def listdir(self, path):
+        dirs, files = self.read_dir(path)
+        return list(dirs) + list(files)
+
+    def subdirs(self, path):
+        return list(self.read_dir(path)[0])
+
+    def entry(self, path):
+        d, n = os.path.split(path)
+        dirs, files = self.read_dir(d)
+        return files.get(n) or dirs.get(n)
+
+    def isfile(self, path) -> bool:
+        e = self.entry(path)
+        return e is not None and e.is_file()
+
+    def getmtime(self, path):
+        e = self.entry(path)
+        if e is None:
+            return os.path.getmtime(path) #raises the usual error
+        return e.stat().st_mtime
+
+    #Works like os.walk(top, topdown=True), but skips irrelevant directories and their contents
+    def walk(self, top, followlinks = True):
+        stack = [top]
+        while stack:
+            root = stack.pop()
+            if is_irrelevant(root):
+                continue
+            dirs, files = self.read_dir(root)
+            yield root, list(dirs), list(files)
+            stack.extend(os.path.join(root, d) for d, e in reversed(list(dirs.items())) if followlinks or not e.is_symlink())
+
+#Watches the files below top for changes. Uses inotify if inotify_simple is installed, otherwise polls every `interval` seconds
+#With inotify only the files and folders named in its events are looked at again, polling scans the whole tree
+#`tree` is a TreeSnapshot that is kept up to date with the changes
+class TreeWatcher:
+    def __init__(self, top, interval = 0.5):
+        self.top = top
+        self.interval = interval
+        self.files = self.scan() #{path : (mtime, size)} of every file
+        self.inotify = None
+        self.watches = {} #{watch descriptor : path of the folder it watches}
+        if inotify_simple:
+            try:
+                self.inotify = inotify_simple.INotify()
+                for d in list(self.tree.listings):
+                    self.add_watch(d)
+            except OSError:
+                self.inotify = None #e.g. too many watches, fall back to polling
+
+    def add_watch(self, d):
+        if is_irrelevant(d):
+            return
+        f = inotify_simple.flags
+        self.watches[self.inotify.add_watch(d, f.MODIFY | f.CLOSE_WRITE | f.CREATE | f.DELETE | f.MOVED_FROM | f.MOVED_TO)] = d
+
+    def scan(self):
+        self.tree = TreeSnapshot()
+        files = {}
+        for root, dirs, fs in self.tree.walk(self.top):
+            for f in fs:
+                try:
+                    st = self.tree.entry(os.path.join(root, f)).stat()
+                except OSError:
+                    continue
+                files[os.path.join(root, f)] = (st.st_mtime, st.st_size)
+        return files
+
+    #Looks at the files `paths` again, returns (changed, added, removed) among them
+    def update(self, paths):
+        changed, added, removed = set(), set(), set()
+        for p in paths:
+            self.tree.invalidate(os.path.split(p)[0])
+        for p in paths:
+            try:
+                st = os.stat(p)
+                new = (st.st_mtime, st.st_size) if stat.S_ISREG(st.st_mode) else None
+            except OSError:
+                new = None
+            old = self.files.get(p)
+            if new is None:
+                if old is not None:
+                    del self.files[p]
+                    removed.add(p)
+                continue
+            self.files[p] = new
+            if old is None:
+                added.add(p)
+            elif old != new:
+                changed.add(p)
+        return changed, added, removed
+
+    #Looks at all files in the folder d again (not its subfolders), returns (changed, added, removed) among them
+    def update_dir(self, d):
+        self.tree.invalidate(d)
+        known = [p for p in self.files if os.path.split(p)[0] == d]
+        return self.update(known + [os.path.join(d, f) for f in self.tree.read_dir(d)[1]])
+
+    #returns the files named by the inotify `events`, or None if events were lost
+    def paths_of_events(self, events):
+        f = inotify_simple.flags
+        paths = set()
+        for e in events:
+            if e.mask & f.Q_OVERFLOW:
+                return None
+            if e.mask & f.IGNORED:
+                self.watches.pop(e.wd, None)
+                continue
+            if e.wd not in self.watches:
+                continue
+            p = os.path.join(self.watches[e.wd], e.name)
+            if is_irrelevant(p):
+                continue
+            if e.mask & f.ISDIR:
+                #Everything below a folder that was moved away or deleted is gone, a new one is watched and read
+                self.tree.invalidate(self.watches[e.wd])
+                paths.update(k for k in self.files if k.startswith(p+os.path.sep))
+                for l in [l for l in self.tree.listings if l == p or l.startswith(p+os.path.sep)]:
+                    self.tree.invalidate(l)
+                if e.mask & (f.CREATE | f.MOVED_TO):
+                    for root, dirs, fs in self.tree.walk(p):
+                        self.add_watch(root)
+                        paths.update(os.path.join(root, n) for n in fs)
+            else:
+                paths.add(p)
+        return paths
+
+    #Blocks until a file changed, returns (changed, added, removed) as sets of paths
+    def wait(self):
+        while True:
+            if self.inotify:
+                events = self.inotify.read()
+                #Editors often save in multiple steps, collect them all before looking
+                more = self.inotify.read(timeout=int(self.interval*200))
+                while more:
+                    events.extend(more)
+                    more = self.inotify.read(timeout=int(self.interval*200))
+                paths = self.paths_of_events(events)
+                if paths is not None:
+                    changed, added, removed = self.update(paths)
+                    if changed or added or removed:
+                        return changed, added, removed
+                    continue
+            else:
+                time.sleep(self.interval)
+            old = self.files
+            self.files = self.scan()
+            if self.inotify:
+                watched = set(self.watches.values())
+                for d in list(self.tree.listings):
+                    if d not in watched:
+                        self.add_watch(d)
+            changed = {f for f in self.files if f in old and old[f] != self.files[f]}
+            added = self.files.keys() - old.keys()
+            removed = old.keys() - self.files.keys()
+            if changed or added or removed:
+                return changed, added, removed
+
+#Runs jobs on a bounded pool of worker threads. Whenever a worker is free it takes the ready job with the highest cost,
+#so long jobs are started first and don't end up as the last ones running on an otherwise idle pool
+#A job is ready once all the jobs it depends on are finished
+class JobServer:
+    def __init__(self, workers):
+        self.workers = max(1, workers)
+        self.pending = [] #heap of (-cost, id, function) of ready jobs
+        self.blocked = {} #{id : [number of unfinished dependencies, cost, function]}
+        self.dependents = {} #{id : [ids of the jobs that depend on it]}
+        self.finished = set()
+        self.unfinished = 0
+        self.counter = 0
+        self.cond = Condition()
+        self.failed = False #set once a job returned False, no further jobs are started then
+        self.error = None #the first exception a job raised, raised again by run()
+
+    #Adds a job and returns its id, which can be used in deps of later jobs
+    def add(self, func, cost = 0, deps = ()):
+        with self.cond:
+            job = self.counter
+            self.counter += 1
+            self.unfinished += 1
+            self.dependents[job] = []
+            open_deps = [d for d in set(deps) if d not in self.finished]
+            for d in open_deps:
+                self.dependents[d].append(job)
+            if open_deps:
+                self.blocked[job] = [len(open_deps), cost, func]
+            else:
+                heapq.heappush(self.pending, (-cost, job, func))
+                self.cond.notify()
+            return job
+
+    def work(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    if self.unfinished == 0:
+                        return
+                    self.cond.wait()
+                job, func = heapq.heappop(self.pending)[1:]
+            ok = False
+            try:
+                ok = func() is not False
+            except Exception as e:
+                with self.cond:
+                    if self.error is None:
+                        self.error = e
+            finally:
+                with self.cond:
+                    self.finished.add(job)
+                    self.unfinished -= 1
+                    if not ok and not self.failed:
+                        #Fail fast: drop everything that didn't start yet, running jobs are finished
+                        self.failed = True
+                        self.unfinished -= len(self.pending) + len(self.blocked)
+                        self.pending = []
+                        self.blocked = {}
+                    for d in self.dependents[job]:
+                        if d not in self.blocked: #dropped after a failure
+                            continue
+                        self.blocked[d][0] -= 1
+                        if self.blocked[d][0] == 0:
+                            b = self.blocked.pop(d)
+                            heapq.heappush(self.pending, (-b[1], d, b[2]))
+                    self.cond.notify_all()
+
+    #Starts the workers and waits until every job is done, or one failed and the running ones are done
+    #Returns False if a job failed. If one raised an exception, that is raised again here
+    def run(self):
+        threads = [Thread(target = self.work) for i in range(self.workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if self.error is not None:
+            raise self.error
+        return not self.failed
+
+#Records how long the phases of a build take, as events of the Chrome trace-event format (can be opened with Perfetto or chrome://tracing)
+#If it isn't enabled, nothing is recorded
+class Tracer:
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.events = []
+        self.lock = Lock()
+        self.t0 = time.perf_counter()
+        self.thread_ids = {} #{thread ident : small number shown as thread id}
+
+    #Records an event that started at `start` (from time.perf_counter()) and ends now
+    #Extra keyword arguments are stored as the events args, e.g. the file it was about
+    def add(self, name, cat, start, **info):
+        if not self.enabled:
+            return
+        end = time.perf_counter()
+        with self.lock:
+            tid = self.thread_ids.setdefault(get_ident(), len(self.thread_ids))
+            self.events.append({"name": name, "cat": cat, "ph": "X", "pid": 0, "tid": tid,
+                                "ts": (start-self.t0)*1e6, "dur": (end-start)*1e6, "args": info})
+
+    #Records the time spent in the with block
+    @contextmanager
+    def span(self, name, cat, **info):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, cat, start, **info)
+
+    #Drops the recorded events and starts the timeline anew, --watch records each rebuild on its own
+    def clear(self):
+        with self.lock:
+            self.events = []
+            self.t0 = time.perf_counter()
+
+    def durations(self, cat, key):
+        return [(e["args"][key], e["dur"]/1e6) for e in self.events if e["cat"] == cat]
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
 
 def get_files_regex(looking_for_file):
     #.normcase converts all filepaths sepperators to system native ones
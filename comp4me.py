@@ -3,9 +3,13 @@ import sys
 import os
 sys.path.append(os.path.realpath(__file__))
 from c_util import *
-from threading import Thread #Multithreading
+from c_cache import *
 import subprocess   #Sys commands
 import time #Debug runtime info
+import hashlib
+import shlex
+import glob
+import json
 try:
     from argparse import ArgumentParser
 except Exception:
@@ -22,7 +26,10 @@ procTime = 0
 
 #Catch abort, don't print pythons default message
 #https://stackoverflow.com/questions/1112343/how-do-i-capture-sigint-in-python
+aborting = False #set once Ctrl-C was pressed, so --watch doesn't mistake the exit for a failed rebuild
 def signal_handler(sig, frame):
+    global aborting
+    aborting = True
     print("\n"+color.RED+"Aborting"+color.END)
     exit()
 signal.signal(signal.SIGINT, signal_handler)
@@ -41,16 +48,34 @@ parser.add_argument('-p', '--print-commands', action='store_true', help="Print a
 parser.add_argument('--no-ccache', action='store_true', help="Use ccache to speed up compilation via caching. Needs to be installed, will not be used if not avaivable.")
 parser.add_argument('-C', '--no-cache', action='store_true', help="Delete cache file before starting compilation")
 parser.add_argument('--print-structure', action='store_true', help="Display a file tree in colors describing the status of each subdir in the project")
-parser.add_argument('-T', '--thread-num', default=1, type=int, help="Number of threads to use for compilation. Using ccache is a greater benefit than multithreading.")
+parser.add_argument('-T', '--thread-num', default=os.cpu_count() or 1, type=int, help="Number of threads to use for compilation, default is the number of CPUs. Using ccache is a greater benefit than multithreading.")
+parser.add_argument('--cache-format', choices=list(cache_backends), default="pickle", help="File format of the cache in build/. Caches of another format are migrated automatically")
+parser.add_argument('--native-includes', action='store_true', help="Find the include paths a file needs by scanning #include statements in-process, the preprocessor is only used to verify the result. Conditional includes are followed as well")
+parser.add_argument('--content-hash', action='store_true', help="Detect changed files by their content instead of only their modification date. Files are only hashed again if their size or modification date changed")
+parser.add_argument('-i', '--incremental', action='store_true', help="Keep object files in the build directory between runs and only recompile sources whose inputs or commands changed")
+parser.add_argument('--thin-archives', action='store_true', help="Bundle libraries into thin archives, which only reference the object files in the build directory instead of copying them")
+parser.add_argument('--trace', metavar="FILE", help="Write how long each phase, preprocessor call, compile command, ar and link took to FILE as Chrome trace events (open it with Perfetto), and print the slowest translation units and headers")
+parser.add_argument('--compdb', action='store_true', help="Write the compile commands of all source files to build/compile_commands.json, for clangd, clang-tidy and other tools")
+parser.add_argument('--compdb-only', action='store_true', help="Only search the projects and write build/compile_commands.json, without compiling or linking anything")
+parser.add_argument('--pch', action='store_true', help="Precompile the system headers most source files of a project include, and use that for all source files that include all of them")
+parser.add_argument('--unity-changed-alone', action='store_true', help="In UNITY folders, compile source files that changed since their batch was compiled on their own from then on, so editing them again only recompiles that file")
+parser.add_argument('--explain', nargs='?', const="-", metavar="JSON_FILE", help="Only search the projects, and print which translation units would be compiled and why, and why files had their includes searched again, with the preprocessor calls that took. uic and moc are not run, the outdated files they would generate are listed. Nothing is compiled and nothing in the build folder, including the cache, is written. With JSON_FILE, that is written to it as JSON instead")
+parser.add_argument('--watch', action='store_true', help="Keep running after the build, and rebuild whenever a file of the project changes. Implies --incremental")
 
 args = parser.parse_args()
+if args.watch:
+    args.incremental = True
+if args.compdb_only:
+    args.compdb = True
+    args.incremental = True #don't delete the object files of previous builds
 
 #Variables Shared between all subprojects
 cache_dictionary = {}
 
-header_files = {} #header files included with -I, dict of {path/filename : File}
-neutral_files = set() #all abs paths of files in neutral folders
-excluded_files = [] #files with an interesting fileending, that were stored in a folder set to be excluded
+#These are indexed by filename, so files needed by #include statements can be found quickly
+header_files = IndexedFileDict() #header files included with -I, dict of {path/filename : File}
+neutral_files = IndexedPathSet() #all abs paths of files in neutral folders
+excluded_files = IndexedPathSet() #files with an interesting fileending, that were stored in a folder set to be excluded
 
 all_proj_dirs_with_links = [] #list to all directories containing projects, includes duplicates
 all_projs = [] #List of all projects as Project() Objects, used to launch all of their tasks
@@ -61,7 +86,11 @@ default_config_definitions = {} #definitions read from the default config file
 default_include_choices = {} #stores answer if, and which specific header file is supposed to be included for each file by default
                                 #or if the user should be asked to make a choice between multiple options again
 
-checked_header_files = [] #list of Header files that got processed already, so we don't deal with them twice
+checked_header_files = PathSet() #paths of Header files that got processed already, so we don't deal with them twice
+
+used_build_subdirs = set() #names of the subfolders in build/ claimed by a project during this run
+tracer = Tracer(args.trace is not None) #records the timings written by --trace
+tree = TreeSnapshot() #the project tree, every folder is only listed once and shared by presort, print-structure and the subproject search
 
 #Only prints if verbose is set (* means any number of arguments, just like usual print)
 def vprint(*t):
@@ -71,8 +100,9 @@ def vprint(*t):
 #Load the cache
 build_dir = os.path.join(os.getcwd(), "build")
 
-if not args.no_cache and os.path.exists(os.path.join(build_dir, "comp_cache")):
-    cache_dictionary = toml.load(os.path.join(build_dir, "comp_cache"))
+cache_store = cache_backends[args.cache_format](build_dir)
+if not args.no_cache:
+    cache_store, cache_dictionary = open_cache(build_dir, args.cache_format)
 
 needed_src = {} #dict of header files that dont need source files/which src they need {path+name:False/Path+Name}
 if "NEEDED_SRC_FILES_SUBCACHE" in cache_dictionary:
@@ -86,10 +116,192 @@ linkerscript_cache = {}
 if "LINKERSCRIPT_TO_USE" in cache_dictionary:
     linkerscript_cache = cache_dictionary["LINKERSCRIPT_TO_USE"]
 
+object_cache = {} #dict of {path/to/obj.o : {"C": command it was compiled with, "D": seconds it took, "H": inputs_digest}}, used by incremental builds and job ordering
+if "OBJECTS" in cache_dictionary:
+    object_cache = cache_dictionary["OBJECTS"]
+
+if "TOOLS" in cache_dictionary:
+    tool_probes.update(cache_dictionary["TOOLS"]) #results of check_presence, see c_util
+
+link_cache = {} #dict of {path of executable/library : fingerprint of the inputs and command it was last made with}
+if "LINKS" in cache_dictionary:
+    link_cache = cache_dictionary["LINKS"]
+
+include_path_sets = {} #{tuple of include directories : the same tuple}, so files with the same include directories share one tuple
+
+#returns the shared tuple of the include directories `paths`, with interned strings
+def share_include_paths(paths):
+    paths = tuple(sys.intern(p) for p in paths)
+    return include_path_sets.setdefault(paths, paths)
+
+#Every distinct tuple of include directories is stored once in the cache, files refer to it by its ID in their "S" entry
+include_sets_by_id = {} #{ID : tuple of include directories}
+include_set_ids = {} #{tuple of include directories : ID}
+if "INCLUDE_SETS" in cache_dictionary:
+    for k, v in cache_dictionary["INCLUDE_SETS"].items():
+        include_sets_by_id[int(k)] = share_include_paths(v)
+        include_set_ids[include_sets_by_id[int(k)]] = int(k)
+
+#returns the ID of the include directories `paths`, giving them a new one if they don't have one yet
+def include_set_id(paths):
+    paths = share_include_paths(paths)
+    if paths not in include_set_ids:
+        include_set_ids[paths] = max(include_sets_by_id, default=-1)+1
+        include_sets_by_id[include_set_ids[paths]] = paths
+    return include_set_ids[paths]
+
+#returns the include directories of a cache entry's "S" value
+#That is an ID, a list of directories (caches of older versions) or a string of -I flags (caches of even older versions)
+def cached_include_paths(s):
+    if type(s) == int:
+        return include_sets_by_id[s]
+    if type(s) == str:
+        return share_include_paths(include_dirs_of_flags(split_args(s)))
+    return share_include_paths(s)
+
+response_file_min_length = 8000 #compile commands with more characters than this get their include directories from a response file
+
+unity_alone = set() #source files in UNITY folders that are compiled on their own because they changed, with --unity-changed-alone
+if "UNITY_ALONE" in cache_dictionary:
+    unity_alone = set(cache_dictionary["UNITY_ALONE"])
+
+pch_cache = {} #dict of {path of precompiled header : {"F": link_fingerprint() of its command and dependencies, "D": those dependencies}}
+if "PCH" in cache_dictionary:
+    pch_cache = cache_dictionary["PCH"]
+
+archive_cache = {} #dict of {path of library : {"T": if it is a thin archive, "M": {path of member : file_stamp() when it was added}}}
+if "ARCHIVES" in cache_dictionary:
+    archive_cache = cache_dictionary["ARCHIVES"]
+
+content_hashes = {} #dict of {path : {"M": mtime, "S": size, "H": digest}}, so files are only hashed again if they were touched
+if "CONTENT_HASHES" in cache_dictionary:
+    content_hashes = cache_dictionary["CONTENT_HASHES"]
+
+#returns the digest content_hashes has for path if the file's modification date and size (from os.stat) still match, None otherwise
+#Entries in another shape, e.g. written by an older version, count as missing
+def cached_digest(path, st):
+    entry = content_hashes.get(path)
+    if isinstance(entry, dict) and entry.get("M") == st.st_mtime and entry.get("S") == st.st_size:
+        return entry.get("H")
+    return None
+
+#returns the content digest of the file at path. It is only hashed again if its size or modification date changed since the last time
+def content_digest(path):
+    st = os.stat(path)
+    digest = cached_digest(path, st)
+    if digest is None:
+        digest = fast_hash_file(path)
+        content_hashes[path] = {"M": st.st_mtime, "S": st.st_size, "H": digest}
+    return digest
+
+#Hashes all files known to content_hashes whose size or modification date changed, in parallel
+#so content_digest() doesn't need to hash them one after another. Forgets files that don't exist anymore
+def prehash_changed_files():
+    changed = []
+    for path in list(content_hashes):
+        try:
+            st = os.stat(path)
+        except OSError:
+            del content_hashes[path]
+            continue
+        if cached_digest(path, st) is None:
+            changed.append((path, st))
+    digests = hash_files([c[0] for c in changed], args.thread_num)
+    for path, st in changed:
+        if path in digests:
+            content_hashes[path] = {"M": st.st_mtime, "S": st.st_size, "H": digests[path]}
+        else: #gone or unreadable since, content_digest() finds out again if it's needed
+            del content_hashes[path]
+
+#returns a string identifying the state of the file at path by its modification date and size, or by its content with --content-hash
+def file_stamp(path):
+    if not os.path.exists(path):
+        return "missing"
+    if args.content_hash:
+        return content_digest(path)
+    st = os.stat(path)
+    return str(st.st_mtime)+":"+str(st.st_size)
+
+#returns a digest of the command and the input files an executable or library is made from
+def link_fingerprint(cmd, inputs):
+    h = hashlib.sha1(cmd.encode())
+    for i in sorted(inputs):
+        h.update((i+":"+file_stamp(i)).encode())
+    return h.hexdigest()
+
+#returns if the file at path didn't change since its cache entry was written.
+#Compares the modification date file_time to the cache time, or with --content-hash the content to the digest stored in the cache
+#Raises KeyError if there is no cache entry for path
+def unchanged_since_cached(path, file_time) -> bool:
+    entry = cache_dictionary[path]
+    if args.content_hash and "H" in entry:
+        return content_digest(path) == entry["H"]
+    return entry["T"] > file_time
+
+#Marks the cache entry of path as up to date at time t
+def mark_up_to_date(path, t):
+    if path not in cache_dictionary:
+        cache_dictionary[path] = {}
+    cache_dictionary[path]["T"] = t
+    if args.content_hash:
+        cache_dictionary[path]["H"] = content_digest(path)
+    else:
+        cache_dictionary[path].pop("H", None)
+
+dep_graph = DependencyGraph() #built from the cached "I" lists by find_dirty_files(), and kept up to date when they are rewritten
+dirty_files = None #files that changed since they were cached, and all files including one of those. Found once per build
+changed_files = set() #files that changed themselves since they were cached
+
+#What --explain reports, besides what would be compiled
+cache_cleared_because = None #why the cache was discarded by a project's configuration check, if it was
+search_reasons = {} #{path : why its includes were searched again}
+prepro_calls = {} #{path : preprocessor commands run to search its includes}
+
+#Finds dirty_files: every file of the dependency graph is stat'ed once, and the ones including a changed file are found by following the graph backwards
+def find_dirty_files():
+    global dirty_files, changed_files
+    for path, entry in cache_dictionary.items():
+        if type(entry) == dict and "I" in entry and path not in dep_graph.includes:
+            dep_graph.set_includes(path, entry["I"])
+    changed = set()
+    for path in dep_graph.nodes():
+        if not tree.isfile(path) or "T" not in cache_dictionary.get(path, {}) or not unchanged_since_cached(path, tree.getmtime(path)):
+            changed.add(path)
+    dirty_files = dep_graph.with_dependents(changed)
+    changed_files = changed
+    if not dep_graph.includes: #cold or discarded cache, the counts would be 0 although everything is searched
+        vprint("No usable cache found, the includes of all files are searched")
+        return
+    vprint(len(changed), "files changed since the last build,", len(dirty_files), "need their includes searched again")
+
+#returns why the includes of the file at path are searched again (see Project.File.is_outdated()), for --explain
+def outdated_reason(path):
+    if path not in cache_dictionary:
+        if cache_cleared_because:
+            return "not in the cache, it was discarded because "+cache_cleared_because
+        return "not in the cache"
+    if "I" not in cache_dictionary[path]:
+        return "no include list in the cache, it was only seen as a header so far"
+    if path in changed_files:
+        return "changed" if tree.isfile(path) else "doesn't exist anymore"
+    includes = cache_dictionary[path]["I"]
+    for h in includes:
+        if h in changed_files:
+            return "includes "+rel_to_top(h)+(", which changed" if tree.isfile(h) else ", which doesn't exist anymore")
+    for h in includes:
+        if h in dirty_files:
+            return "includes "+rel_to_top(h)+", which includes a changed file"
+    return "includes a changed file"
+
+#returns the name of the unity batch made of the source files `files` in language `lang`
+#It only depends on its files, so other batches changing doesn't change its name and make it compile again
+def unity_batch_name(files, lang):
+    return "__unity_"+lang+"_"+hashlib.sha1("\n".join(sorted(str(f) for f in files)).encode()).hexdigest()[:12]
+
 class Project:
     def __init__(self, md="", ftu="", is_top_level = False, inherited_definitions = {}):
         global cache_dictionary, neutral_files, header_files, excluded_files, all_projs, build_dir
-        global procTime, subproject_usage_cache, needed_src
+        global procTime, subproject_usage_cache, needed_src, cache_cleared_because
 
         #region-----------VARIABLE DECLARATIONS--------------------
 
@@ -99,6 +311,10 @@ class Project:
         #List of directories in this Project that are to compiled into a library
         self.lib_dirs = []
 
+        #List of directories in this Project whose source files are compiled in unity batches of up to unity_size files
+        self.unity_dirs = []
+        self.unity_size = 8
+
         #List of directories in this Project that are made an Entrypoint via Cmd Argument
         self.extra_folders = []
 
@@ -144,41 +360,42 @@ class Project:
                 cache_dictionary = {}
                 subproject_usage_cache = {}
                 cache_dictionary["HASHES"] = tmp
+                cache_cleared_because = "the configuration "+rel_to_top(os.path.join(self.main_directory, self.config_file_to_use))+" changed"
         else:
             tmp = cache_dictionary["HASHES"]
             cache_dictionary = {}
             subproject_usage_cache = {}
             cache_dictionary["HASHES"] = tmp
+            cache_cleared_because = "the project "+rel_to_top(self.main_directory)+" wasn't part of the last build"
         cache_dictionary["HASHES"][self.main_directory] = hash
         if "MOC_REALPATHS" not in cache_dictionary:
             cache_dictionary["MOC_REALPATHS"] = []
 
         print(color.BOLD+"Initializing Project"+color.END, rel_to_top(self.main_directory))
         #create build dir structure
-        if is_top_level:
+        #--explain doesn't touch the build dir
+        if is_top_level and not args.explain:
             if not os.path.exists(build_dir):
                 os.mkdir(build_dir)
-                os.mkdir(os.path.join(build_dir, self.build_subdir))
             else:
-                for root, dirs, files in os.walk(build_dir):
-                    for f in files:
-                        if args.no_cache and f == "comp_cache":
-                            os.unlink(os.path.join(root, f))
-                    for d in dirs:
-                        shutil.rmtree(os.path.join(root, d))
-                os.mkdir(os.path.join(build_dir, self.build_subdir))
-        else:
-            #Detect subprojects with the same name and don't let the user do that
-            try:
-                os.mkdir(os.path.join(build_dir, self.build_subdir))
-            except FileExistsError:
-                print(error_string+"Subproject with name", self.build_subdir,"defined twice")
-                print("Multiple Symbolic links to the same Project are allowed, but Projects themselves must have unique names")
-                exit()
+                if args.no_cache:
+                    delete_cache(build_dir)
+                #Incremental builds keep the object files of the previous run, stale ones are pruned after compiling
+                if not args.incremental:
+                    for d in os.listdir(build_dir):
+                        if os.path.isdir(os.path.join(build_dir, d)):
+                            shutil.rmtree(os.path.join(build_dir, d))
+
+        #Detect subprojects with the same name and don't let the user do that
+        if self.build_subdir in used_build_subdirs:
+            print(error_string+"Subproject with name", self.build_subdir,"defined twice")
+            print("Multiple Symbolic links to the same Project are allowed, but Projects themselves must have unique names")
+            exit()
+        used_build_subdirs.add(self.build_subdir)
 
-        os.mkdir(os.path.join(build_dir, self.build_subdir, "non_prop"))
-        os.mkdir(os.path.join(build_dir, self.build_subdir, "obj"))
-        os.mkdir(os.path.join(build_dir, self.build_subdir, "lib"))
+        for d in ("non_prop", "obj", "lib"):
+            if not args.explain:
+                os.makedirs(os.path.join(build_dir, self.build_subdir, d), exist_ok=True)
 
         #files that will be included in compilation, dict of {filename_no_ext : File}
         self.src_files = {} 
@@ -190,8 +407,9 @@ class Project:
         #!! If GENERATE_TEST is true, this will be set to a default of ["test"]
 
         #Strings to link precompiled sources, private means placed in a non-prop and entry folders, public is only entry
-        self.private_precomps = ""
-        self.public_precomps = ""
+        self.private_precomps = []
+        self.public_precomps = []
+        self.pch_plan = None #with --pch: {language : {"header", "output", "cmd", "users"}}, see plan_pch()
 
         #every sourcefile in entries will be compiled into a .o file, and ressources for that will be searched for primarily (=> no duplicate names of src files allowed)
         #in all header files located in (sub) folders of any target folder
@@ -199,15 +417,15 @@ class Project:
         #if there are multiple options that lie in a target folder, the user will be asked to make a choice (see fill_includes)
         #sourcefiles for headerfiles will be searched for primarily in target folders. if none are found there, none will be used
         #if a/multiple are found outside a target folder, the user will be asked to make a choice
-        self.entries = []
+        self.entries = PathSet()
 
         #files in excluded folders will not be put in entry_files, but in excluded_files
         #if there is no match for a needed file in other valid folders, but one is found in an excluded folder, the user will be told about that
-        self.excludes = []
+        self.excludes = PathSet()
 
         self.exclude_src_dirs = []
 
-        self.manual_neutrals = []
+        self.manual_neutrals = PathSet()
 
         #List of directories of found subprojects, used to not compile files located in them again
         self.subproject_dirs = []
@@ -341,6 +559,13 @@ class Project:
                         self.lib_dirs.append(os.path.join(self.main_directory,definitions["AS_LIB"]))
                     else:
                         self.lib_dirs.extend([os.path.join(self.main_directory, x) for x in definitions["AS_LIB"]])
+                if "UNITY" in definitions:
+                    if type(definitions["UNITY"]) == str:
+                        self.unity_dirs.append(os.path.join(self.main_directory,definitions["UNITY"]))
+                    else:
+                        self.unity_dirs.extend([os.path.join(self.main_directory, x) for x in definitions["UNITY"]])
+                if "UNITY_SIZE" in definitions:
+                    self.unity_size = max(1, int(definitions["UNITY_SIZE"]))
                 if "EXCLUDED_FILES" in definitions:
                     excluded_files.extend([os.path.join(self.main_directory, a) for a in definitions["EXCLUDED_FILES"]])
                 if "GENERATE_TEST" in definitions:
@@ -353,7 +578,7 @@ class Project:
                     #if this is set, and NON_PROPAGATE is not, ENTRYPOINT will not be propagated
                     #also an executable will be generated
                 if generate_tests:
-                    self.non_propageted_dirs = [os.path.abspath(os.path.join(self.main_directory, name)) for name in os.listdir(self.main_directory) if os.path.isdir(os.path.join(self.main_directory, name)) and name.endswith("test")]
+                    self.non_propageted_dirs = [os.path.abspath(os.path.join(self.main_directory, name)) for name in tree.subdirs(self.main_directory) if name.endswith("test")]
                     self.entries.extend(self.non_propageted_dirs)
                 elif self.generate_executable:
                     self.non_propageted_dirs = self.entries
@@ -391,6 +616,10 @@ class Project:
         defs.update(inherited_definitions)
         defs.update(read_definitions(os.path.join(self.main_directory, self.config_file_to_use)))
         parse(defs)
+        #Flags are split into arguments like a shell would, but no shell runs them, so $(...), `...` and $VAR stay as they are
+        for fl in dict.fromkeys(self.cflags + self.cppflags + self.linkerflags):
+            if shell_expansion_match.search(fl):
+                print(warning_string+"The flags", fl, "of", rel_to_top(os.path.join(self.main_directory, self.config_file_to_use)), "are not passed through a shell, $(...), `...` and $VARIABLES in them are not expanded")
         if not entrypoint_was_defined:
             vprint("No entrypoint was defined for project", self.main_directory+". Adding the top-level folder")
             self.entries.append(self.main_directory)
@@ -400,15 +629,19 @@ class Project:
 
         #If no manual Excludes are defined, ignore top level folders called "*test"
         if not generate_tests and len(self.excludes) == 0:
-            x = [os.path.abspath(os.path.join(self.main_directory, name)) for name in os.listdir(self.main_directory) if os.path.isdir(os.path.join(self.main_directory, name)) and name.endswith("test")]
+            x = [os.path.abspath(os.path.join(self.main_directory, name)) for name in tree.subdirs(self.main_directory) if name.endswith("test")]
             self.excludes.extend(x)
 
         #Clean -lib-folders, extra-folders, excludes and entries args of trailing '/'
         def rm_backslash(l):
-            for i in range(len(l)):
-                if l[i].endswith(os.path.sep):
-                   l[i] = l[i][:-1]
+            stripped = [p[:-1] if p.endswith(os.path.sep) else p for p in l]
+            if isinstance(l, PathSet):
+                l.clear()
+                l.extend(stripped)
+            else:
+                l[:] = stripped
         rm_backslash(self.lib_dirs)
+        rm_backslash(self.unity_dirs)
         rm_backslash(self.extra_folders)
         rm_backslash(self.excludes)
         rm_backslash(self.entries)
@@ -419,6 +652,10 @@ class Project:
             if not os.path.exists(L):
                 print(error_string+"Library path",L,"wasn't found in any directory of project in", self.main_directory)
                 exit()
+        for L in self.unity_dirs:
+            if not os.path.exists(L):
+                print(error_string+"Unity path",L,"wasn't found in any directory of project in", self.main_directory)
+                exit()
         for L in self.entries:
             if not os.path.exists(L):
                 print(error_string+"Entrypoint path",L,"wasn't found in any directory of project in", self.main_directory)
@@ -508,58 +745,54 @@ class Project:
                 self.cppcomp = "ccache "+self.cppcomp
         #endregion
 
-        for u in qt5_dirs:
-            qt5_make(os.path.join(self.main_directory,u), self.header_fileendings, qt_path_changed)
+        self.qt5_dirs = [os.path.normpath(os.path.join(self.main_directory,u)) for u in qt5_dirs] #QT5_MAKE folders, --watch runs qt5_make again when they change
+        self.stale_qt_outputs = [] #with --explain: [(generated file, command that would generate it)] of uic and moc outputs that are outdated
+        for u in self.qt5_dirs:
+            self.stale_qt_outputs.extend(qt5_make(u, self.header_fileendings, qt_path_changed, tree, dry_run = args.explain))
         #endregion
 
     #region-----------------FILE CLASS-------------------------
     class File:
+        #Big projects have a File for every header, so they don't get a __dict__
+        __slots__ = ("name", "name_no_ext", "path", "ext", "abspath", "reason", "include_paths", "compiled_to_lib_folder", "project", "modtime")
+
         def __init__(self, project, name, path, reas, modtime = None):
             self.name = name #filename with extension
             n_e = os.path.splitext(name)
             self.name_no_ext = n_e[0]
-            self.path = path #filepath without filename
-            self.ext = n_e[1] #fileextension
-            self.reason = reas #which file requires the inclusion of this file, may also be the a target folder
-            self.include_string = "" #safes the include string of this file, so it doesn't
-                                        #need to be calculated again every time this file is included
+            self.path = sys.intern(path) #filepath without filename, interned since many files share it
+            self.ext = sys.intern(n_e[1]) #fileextension
+            self.abspath = os.path.join(self.path, name)
+            self.reason = str(reas) #which file requires the inclusion of this file, may also be the a target folder
+            self.include_paths = () #safes the include directories of this file, so they don't
+                                        #need to be calculated again every time this file is included. Shared with other files, see share_include_paths()
             self.compiled_to_lib_folder = is_path_in_any_dir(path, project.lib_dirs)
             self.project = project
             if modtime == None:
-                self.modtime = os.path.getmtime(os.path.join(path, name))
+                self.modtime = tree.getmtime(self.abspath)
             else:
                 self.modtime = modtime
             pass
 
         #self to string, used for printing and indexing in dicts
         def __str__(self) -> str:
-            return os.path.join(self.path, self.name)
+            return self.abspath
         
-        #looks up when the file was modified and compares that to the cache date
+        #looks up if the file or any file it includes changed since they were cached, see find_dirty_files()
         def is_outdated(self) -> bool:
-            if str(self) in cache_dictionary and cache_dictionary[str(self)]["T"]>self.modtime:
-                try:
-                    for f in cache_dictionary[str(self)]["I"]:
-                        cache_time = cache_dictionary[f]["T"]
-                        if f in header_files:
-                            file_time = header_files[f].modtime
-                        else:
-                            if os.path.exists(f):
-                                file_time = os.path.getmtime(f)
-                            else: file_time = cache_time + 500 #File doenst exist anymore!
-                        if cache_time < file_time:
-                            return True
-                except KeyError:
-                    #Catch KeyError on ["I"], happens if a source file is included as header, and a file
-                    #that includes it gets an earlier run than the sourcefile itself, so only ["T"] is written, ["I"] not yet
-                    return True
-            else:
-                return True
-            return False
+            if dirty_files is None:
+                find_dirty_files()
+            #No ["I"] happens if a source file is included as header, and a file
+            #that includes it gets an earlier run than the sourcefile itself, so only ["T"] is written, ["I"] not yet
+            outdated = str(self) not in cache_dictionary or "I" not in cache_dictionary[str(self)] or str(self) in dirty_files
+            if outdated and args.explain:
+                search_reasons[str(self)] = outdated_reason(str(self))
+            return outdated
         
         #searches for neccessary files using the preprocessor. Returns those in a list. Uses a caching system
+        #This is a generator: it yields every preprocessor command it needs the output of, and expects that output to be sent back,
+        #so the preprocessor calls of many files can be run in parallel by run_fill_includes()
         def fill_includes(self):
-            global procTime
             inc_ret_list = [] #Files this file includes, as list of File objects
             inc_cache_list = [] #Files this file includes, as list of abs Paths. Used as cache
 
@@ -593,40 +826,25 @@ class Project:
             #Caching mechanism
             outdated = self.is_outdated()
             if not outdated:
-                self.include_string = cache_dictionary[str(self)]["S"]
+                self.include_paths = cached_include_paths(cache_dictionary[str(self)]["S"])
                 combine(cache_dictionary[str(self)]["I"])
-                cache_dictionary[str(self)] = {"T": time.time(), "I":inc_cache_list, "S": self.include_string}
+                cache_dictionary[str(self)] = {"I":inc_cache_list, "S": include_set_id(self.include_paths)}
+                dep_graph.set_includes(str(self), inc_cache_list)
+                mark_up_to_date(str(self), time.time())
                 return inc_ret_list
 
+            #the search starts without include directories, --watch searches the same File again when it changed
+            self.include_paths = ()
             c_f = self.project.get_comp_flags(self)
 
-            #Runs the preprocessor with a command that makes it return the first Headerfile that wasn't found
-            def runPrepro():
-                global procTime
-                ttt = time.time()
-                cmd = "echo | "+c_f[0]+" -E -MM -Wno-everything " + str(self) + self.include_string+ " "+c_f[1]
-                tmp = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-                procTime+=time.time()-ttt
-                return tmp
+            #Preprocessor command that makes it return the first Headerfile that wasn't found
+            def prepro_cmd():
+                return c_f[0] + ["-E", "-MM", "-Wno-everything", str(self)] + include_args(self.include_paths) + c_f[1]
                 
-            output = runPrepro()
-
-            #While the preprocessor has files it doesn't find
-            while output.stderr:
-                error_list = error_match.findall(output.stderr)
-                if len(error_list) > 0 :
-                    looking_for_file = error_match.findall(output.stderr)[0]
-                else:
-                    print(error_string+"IN PREPRO. PARSING:")
-                    print(output.stderr)
-                    print("When trying to parse file:")
-                    print(self)
-                    print("Maybe there is something wrong with the Flags, or missing global dependencies?")
-                    exit()
-
-                if looking_for_file[0] == '\'' or looking_for_file[0] == '"':
-                    looking_for_file = looking_for_file[1:-1]
-
+            #Decides which file is meant by the include statement looking_for_file (asking the user if that's ambiguous),
+            #and adds the path it is found in to the include string
+            #If only_if_found is set, nothing happens if no such file is in any project, instead of exiting with an error
+            def add_include_path(looking_for_file, only_if_found = False) -> bool:
                 filesearch = get_files_regex(looking_for_file)
                 
                 non_target_matches = [] #List of Files that weren't choosen because a fitting file in a target folder was present, only used for user printout
@@ -648,16 +866,16 @@ class Project:
                     def find_anywhere():
                         if os.path.splitext(looking_for_file)[1] in self.project.header_fileendings:
                             #try to find match in header_files
-                            for path_name, existing_file in header_files.items():
+                            for path_name in header_files.paths_named(looking_for_file):
                                 if filesearch.findall(path_name): #if a listed header file matches the we are looking for
-                                    possible_files.append({"f":existing_file, "is_raw":False}) #save it as possibility
+                                    possible_files.append({"f":header_files[path_name], "is_raw":False}) #save it as possibility
                         else:
                             #try to match in src_files
                             for file in self.project.src_files.values():
                                 if filesearch.findall(str(file)):
                                     possible_files.append({"f":file, "is_raw":False})
                         #try to match in neutral_files
-                        for abs_path in neutral_files:
+                        for abs_path in neutral_files.paths_named(looking_for_file):
                             if filesearch.findall(abs_path):
                                 possible_files.append({"f":abs_path, "is_raw":True})
 
@@ -672,7 +890,7 @@ class Project:
                         #                possible_files.append({"f":file, "is_raw":False, "is_src_from_other"})
 
                         #try to match in excluded_files
-                        for abs_path in excluded_files:
+                        for abs_path in excluded_files.paths_named(looking_for_file):
                             if filesearch.findall(abs_path):
                                 excluded_matches.append(abs_path)
 
@@ -680,6 +898,8 @@ class Project:
                     
                     #ERROR: No matching files were found anywhere
                     if len(possible_files) == 0:
+                        if only_if_found:
+                            return False
                         print(error_string+"File", looking_for_file,"is required by",self, "but no file like this is in this project")
                         if len(excluded_matches) > 0:
                             print("Matches were found in excluded folders:")
@@ -780,7 +1000,7 @@ class Project:
                 #Adding the file
                 f = choosen_file["f"]
                 ipath = abspath_to_relpath(f, looking_for_file)
-                self.include_string+=" -I "+ ipath
+                self.include_paths += (ipath,)
 
                 #Meta-include ambiguity detection data collection
                 all_inc_paths.append(ipath)
@@ -794,16 +1014,57 @@ class Project:
                     print("Ignored None-Target matches for needed file",looking_for_file, "as file in target folder", choosen_file["f"], "was found:")
                     for nm in non_target_matches:
                         print("\t"+nm)
+                return True
 
-                output = runPrepro()
+            #Follows the #include statements of this file and the project files it includes in-process, resolving them against
+            #the include paths found so far, and adding include paths for the ones that aren't found, like the loop below would
+            #Statements that don't match any file in the projects (e.g. system headers) are left for the preprocessor to check
+            def native_scan():
+                search_dirs = include_dirs_of_flags(c_f[1]) + compiler_include_dirs(c_f[0], c_f[1], self.ext in self.project.srcC_fileendings)
+                scanned = set()
+                to_scan = [str(self)]
+                while to_scan:
+                    fp = to_scan.pop()
+                    if fp in scanned:
+                        continue
+                    scanned.add(fp)
+                    for incl, quoted in read_includes_with_kind(fp):
+                        #Only #include "..." looks in the including file's own directory first
+                        found = find_in_dirs(incl, ([os.path.split(fp)[0]] if quoted else []) + all_inc_paths + search_dirs)
+                        if not found and add_include_path(incl, only_if_found=True):
+                            found = find_in_dirs(incl, all_inc_paths[-1:])
+                        #Only follow files of the projects, system headers don't add include paths
+                        if found and found.startswith(top_level_dir):
+                            to_scan.append(found)
+
+            if args.native_includes:
+                native_scan()
+
+            #Run the preprocessor, with native_scan() this usually only verifies the found include paths
+            output = yield prepro_cmd()
 
-            inc_list = output.stdout.split() #List of all files that self includes
-            
-            if len(inc_list) == 2:
-                inc_list = []
-            elif len(inc_list) >= 3:
-                inc_list = inc_list[3:]
-            inc_list = [i for i in inc_list if i != "\\" and i != "//"]
+            #While the preprocessor has files it doesn't find
+            while output.stderr:
+                error_list = error_match.findall(output.stderr)
+                if len(error_list) > 0 :
+                    looking_for_file = error_match.findall(output.stderr)[0]
+                else:
+                    print(error_string+"IN PREPRO. PARSING:")
+                    print(output.stderr)
+                    print("When trying to parse file:")
+                    print(self)
+                    print("Maybe there is something wrong with the Flags, or missing global dependencies?")
+                    exit()
+
+                if looking_for_file[0] == '\'' or looking_for_file[0] == '"':
+                    looking_for_file = looking_for_file[1:-1]
+
+                add_include_path(looking_for_file)
+                output = yield prepro_cmd()
+
+            #Output looks like "name.o: path/to/self.c dep1.h \\ dep2.h", skip the target and self
+            inc_list = [i for i in split_make_rule(output.stdout) if i != "//"] #List of all files that self includes
+            inc_list = inc_list[2:]
             if len(inc_list) > 0:
                 combine(inc_list)
 
@@ -856,27 +1117,73 @@ class Project:
 
             #Save cache for main
             t_n = time.time()
-            cache_dictionary[str(self)] = {"T": t_n, "I":inc_cache_list, "S": self.include_string}
+            self.include_paths = share_include_paths(self.include_paths)
+            cache_dictionary[str(self)] = {"I":inc_cache_list, "S": include_set_id(self.include_paths)}
+            dep_graph.set_includes(str(self), inc_cache_list)
+            mark_up_to_date(str(self), t_n)
             for f in inc_ret_list:
                 #Headerfiles only need a time, since they aren't getting compiled on their own
                 #But we dont want to erase any info that might be there, since inc_ret_list also may contain included src-files..
                 #So this check is neccessary
-                if str(f) in cache_dictionary:
-                    cache_dictionary[str(f)]["T"] = t_n
-                else:
-                    cache_dictionary[str(f)] = {"T": t_n}
+                mark_up_to_date(str(f), t_n)
 
             return inc_ret_list
     #endregion
 
-    #returns the needed compiler/falgs for a given file
+    #Runs fill_includes() of all `files`. Their preprocessor calls are run in parallel, everything else
+    #(user interaction, changes to header_files, neutral_files and the cache) happens in this thread, in the order of `files`
+    #Returns the list of included files for each file
+    @staticmethod
+    def run_fill_includes(files):
+        global procTime
+        results = [None]*len(files)
+        steps = [f.fill_includes() for f in files]
+        pending = {} #{index of file : preprocessor command it waits for}
+
+        #Runs the generator of file i until it needs the preprocessor, or is done
+        def advance(i, output):
+            try:
+                pending[i] = steps[i].send(output)
+            except StopIteration as e:
+                results[i] = e.value
+
+        for i in range(len(files)):
+            advance(i, None)
+        while pending:
+            ttt = time.time()
+            outputs = {}
+            failures = {} #{index of file : why its preprocessor couldn't be run}
+            jobs = JobServer(args.thread_num)
+            for i, cmd in pending.items():
+                if args.explain:
+                    prepro_calls.setdefault(str(files[i]), []).append(shlex.join(cmd))
+                #Returns False if the preprocessor couldn't be started, which stops the other calls
+                def prepro(i, cmd):
+                    with tracer.span("preprocess "+files[i].name, "preprocess", file=str(files[i])):
+                        try:
+                            outputs[i] = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, text=True)
+                        except OSError as e:
+                            failures[i] = str(e)
+                            return False
+                jobs.add(lambda i=i, cmd=cmd: prepro(i, cmd))
+            if not jobs.run():
+                for i, reason in failures.items():
+                    print(error_string+"Couldn't run the preprocessor for", files[i], "\n\t"+shlex.join(pending[i]), "\n\t"+reason)
+                exit()
+            procTime+=time.time()-ttt
+            pending = {}
+            for i in sorted(outputs):
+                advance(i, outputs[i])
+        return results
+
+    #returns the needed compiler/falgs for a given file, both as lists of arguments
     def get_comp_flags(self, f):
         if f.ext in self.srcC_fileendings:
-            comp = self.ccomp
-            flags = " "+ (" ".join(self.cflags))
+            comp = split_args(self.ccomp)
+            flags = split_args(self.cflags)
         elif f.ext in self.srcCpp_fileendings or f.ext in self.header_fileendings:
-            comp = self.cppcomp
-            flags = " "+ (" ".join(self.cppflags))
+            comp = split_args(self.cppcomp)
+            flags = split_args(self.cppflags)
         else:
             print("It feels wrong to not have an 'else'-part for this. This will never run. If it does, something has gone TERRIBLY wrong")
             exit()
@@ -888,10 +1195,7 @@ class Project:
         #root = current folder
         #dirs = dirs contained in current folder
         #files = files contained in current folder
-        for root, dirs, files in os.walk(self.main_directory, topdown=True, followlinks=True):
-            ##Ignore hidden folders and build
-            if is_irrelevant(root):
-                continue
+        for root, dirs, files in tree.walk(self.main_directory): #skips hidden folders and build
             for f in files:
                 pf = os.path.join(root,f) 
                 if pf in neutral_files:
@@ -957,9 +1261,9 @@ class Project:
                     for prec in precom_abs_path_list:
                         if prec in excluded_files:
                             continue
-                        self.private_precomps+=prec+" "
+                        self.private_precomps.append(prec)
                         if not root.startswith(tuple(self.non_propageted_dirs)):
-                            self.public_precomps+=prec+" "
+                            self.public_precomps.append(prec)
 
                     self.entry_files.extend(abs_path_list)
                     for d in dirs:
@@ -1011,10 +1315,10 @@ class Project:
                 exit()
 
         #Create folders to put the obj that will be bundeled into a lib into
-        if len(self.lib_dirs) > 0:
+        if len(self.lib_dirs) > 0 and not args.explain:
             for L in self.lib_dirs:
                 name = os.path.split(L)[1]
-                os.mkdir(os.path.join(build_dir,self.build_subdir, name))
+                os.makedirs(os.path.join(build_dir,self.build_subdir, name), exist_ok=True)
 
         #Check if lib-folders are in entries:
         for L in self.lib_dirs:
@@ -1029,7 +1333,7 @@ class Project:
             how_many_added_counter = 0
             just_added = []
             for Lp in (excluded_files, neutral_files):  
-                for p in Lp:
+                for p in Lp.paths_named(j):
                     i = arg_search.findall(p)
                     if i:
                         how_many_added_counter += 1
@@ -1091,7 +1395,7 @@ class Project:
         for root in self.subproject_dirs:
             #Find all comp.toml files
             comp_match = []
-            for f in os.listdir(root):
+            for f in tree.listdir(root):
                 comp_match.extend(comp_reg.findall(f))
 
             #Read cache for prev usage
@@ -1119,7 +1423,7 @@ class Project:
                 if inp.capitalize() != "Y":
                     print("Okay, proceeding to handle this folder like an excluded folder")
                     self.excludes.append(root)
-                    for nroot, dirs, files in os.walk(root, topdown=True, followlinks=False):
+                    for nroot, dirs, files in tree.walk(root, followlinks=False):
                         for fe in files:
                             if os.path.splitext(fe)[1] in self.allowed_fileendings:
                                 excluded_files.append(os.path.join(nroot, fe))
@@ -1147,9 +1451,11 @@ class Project:
                 if os.path.realpath(pr.main_directory) == os.path.realpath(root) and pr.config_file_to_use == file_to_use:
                     proj_exists_already = True
             if not proj_exists_already:
-                subproj = Project(root, file_to_use, inherited_definitions=self.to_be_inherited_definitions)
+                with tracer.span("configure "+rel_to_top(root), "config"):
+                    subproj = Project(root, file_to_use, inherited_definitions=self.to_be_inherited_definitions)
                 all_projs.append(subproj)
-                subproj.presort()
+                with tracer.span("presort "+rel_to_top(root), "presort"):
+                    subproj.presort()
         
         
     def search(self, src_additions = []):
@@ -1194,16 +1500,17 @@ class Project:
 
         while all_additions: #run this until we dont add any more ressources
             counter+=1
+            it_t = time.perf_counter()
+            searched = len(src_additions) #src_additions is replaced by the files found in this iteration below
             vprint("Iteration", counter)
 
             #find all missing header files for src+header files 
             new_header_additions = []
             #Only go through src_additions to ignore unneded Header Files
-            for file in src_additions:
-                included_files = file.fill_includes()
+            for included_files in self.run_fill_includes(src_additions):
                 for i_f in included_files:
-                    if i_f not in checked_header_files:
-                        checked_header_files.append(i_f) #don't compute a file mutiple times
+                    if str(i_f) not in checked_header_files:
+                        checked_header_files.add(str(i_f)) #don't compute a file mutiple times
                         new_header_additions.append(i_f) #only check them in the next run, not any other following ones
                 
 
@@ -1228,7 +1535,7 @@ class Project:
 
                 #use needed_src cache
                 if str(file) in needed_src:
-                    if str(file) in cache_dictionary and cache_dictionary[str(file)]["T"] > file.modtime:
+                    if str(file) in cache_dictionary and unchanged_since_cached(str(file), file.modtime):
                         if needed_src[str(file)]:
                             sp = os.path.split(needed_src[str(file)])
                             path = sp[0]
@@ -1288,150 +1595,762 @@ class Project:
             src_additions = new_src_additions.copy()
             all_additions = new_header_additions.copy()
             all_additions.extend(src_additions)
+            tracer.add("search iteration "+str(counter), "search", it_t, project=rel_to_top(self.main_directory), files=searched)
 
         vprint("Iterative include-search done in",time.time()-s_t,"s")   
   
-    def compile(self):
-        print(color.BOLD+"Compiling Object-files"+color.END+ " for project", rel_to_top(self.main_directory))
-        s_t = time.time()
-
-        def gen_o(src_files_slice):
-            #This is multithreaded! But no writing to shared variables happens here, and no Files in src_files_slice
-            #Are handeled by 2 Threads (ensured by get_chunks())
-            for f in src_files_slice:
-                comp, flags = self.get_comp_flags(f)
-                include_string = f.include_string
-                if f.compiled_to_lib_folder:
-                    dir = os.path.join(build_dir, self.build_subdir, f.compiled_to_lib_folder)
-                else:
-                    if f.path.startswith(tuple(self.non_propageted_dirs)):
-                        dir = os.path.join(build_dir, self.build_subdir, "non_prop")
-                    else:                       
-                        dir = os.path.join(build_dir, self.build_subdir, "obj")
-                cmd = comp +" "+include_string + " -c "+os.path.join(f.path, f.name) + " -o " + os.path.join(dir, f.name_no_ext+".o")+flags+os.linesep
-                if args.print_commands:
-                    print(cmd)
-                output = subprocess.run(cmd, shell=True)
-
-        to_comp = chunks(list(self.src_files.values()),args.thread_num) #Split source files to compile into N lists
-        threads = []
-        for i in range(args.thread_num): #Start N threads, each working on compiling a list
-            thread = Thread(target = gen_o, args = (to_comp[i],))
-            threads.append(thread)
-            thread.start()
-        for i in range(args.thread_num): #Wait for them all to finish
-            threads[i].join()
-
-        vprint("Done in",time.time()-s_t,"s")
-
-        #Bundle each declared library into a .a
-        for L in self.lib_dirs:
-            name = os.path.split(L)[1]
-            print(color.BOLD+"Bundeling Libray"+color.END, name)
-            cmd = self.ar+" rc "+os.path.join(build_dir,self.build_subdir,"lib", name+".a")+" "+os.path.join(build_dir,self.build_subdir, name,"*")
-            if args.print_commands:
-                print(cmd)
-            subprocess.run(cmd, shell=True)
-        
-def link():
-    s_t = time.time()    
+    #returns the path of the object file a source file is compiled into
+    def get_obj_path(self, f):
+        if f.compiled_to_lib_folder:
+            dir = os.path.join(build_dir, self.build_subdir, f.compiled_to_lib_folder)
+        else:
+            if f.path.startswith(tuple(self.non_propageted_dirs)):
+                dir = os.path.join(build_dir, self.build_subdir, "non_prop")
+            else:                       
+                dir = os.path.join(build_dir, self.build_subdir, "obj")
+        return os.path.join(dir, f.name_no_ext+".o")
+
+    #returns the command compiling the source file f into obj, as a list of arguments
+    #If it is long and `rsp` is set, the include directories are passed in a response file
+    def compile_command(self, f, obj, rsp = True):
+        comp, flags = self.get_comp_flags(f)
+        cmd = comp + self.pch_args([f]) + include_args(f.include_paths) + ["-c", str(f), "-o", obj] + flags
+        if rsp and f.include_paths and len(shlex.join(cmd)) > response_file_min_length:
+            cmd = comp + self.pch_args([f]) + ["@"+self.response_file(f.include_paths)] + ["-c", str(f), "-o", obj] + flags
+        return cmd
+
+    #returns the command compiling the unity batch file `batch`, made of the source files `files`, into obj
+    def unity_command(self, files, batch, obj):
+        comp, flags = self.get_comp_flags(files[0])
+        paths = []
+        for f in files:
+            paths.extend(p for p in f.include_paths if p not in paths)
+        cmd = comp + self.pch_args(files) + include_args(paths) + ["-c", batch, "-o", obj] + flags
+        if paths and len(shlex.join(cmd)) > response_file_min_length:
+            cmd = comp + self.pch_args(files) + ["@"+self.response_file(paths)] + ["-c", batch, "-o", obj] + flags
+        return cmd
+
+    #returns the path of a response file passing the include directories `paths` to the compiler, in build/<project>/rsp/
+    #It is named after their hash, so a command using it changes whenever they do
+    def response_file(self, paths):
+        content = shlex.join(include_args(paths))+"\n"
+        rsp = os.path.join(build_dir, self.build_subdir, "rsp", "inc_"+hashlib.sha1(content.encode()).hexdigest()[:16]+".rsp")
+        if not os.path.exists(rsp) and not args.explain:
+            os.makedirs(os.path.split(rsp)[0], exist_ok=True)
+            with open(rsp+".tmp", "w") as r:
+                r.write(content)
+            os.replace(rsp+".tmp", rsp)
+        return rsp
+
+    #returns the arguments using the precompiled header, if all `files` use the same one with --pch
+    def pch_args(self, files):
+        if not args.pch:
+            return []
+        for plan in self.get_pch_plan().values():
+            if all(str(f) in plan["users"] for f in files):
+                return ["-include", plan["header"]]
+        return []
+
+    #returns what compile() compiles, as a list of {"src": file given to the compiler, "obj", "cmd", "files": source files it consists of}
+    #Every source file is compiled on its own, except for those in UNITY folders. Those are compiled in batches of up to unity_size files,
+    #which get a generated file #including them in build/<project>/unity/. Files that share most headers are put together.
+    #Files defining the same static symbols or macros as another one, and those in unity_alone, are compiled on their own
+    def compile_units(self):
+        if not args.unity_changed_alone:
+            unity_alone.clear()
+        units = []
+        groups = {} #{(object folder, language) : [source files]}, files that can be batched together
+        unity_sources = set() #the generated files of all batches
+        for f in self.src_files.values():
+            obj = self.get_obj_path(f)
+            is_c = f.ext in self.srcC_fileendings
+            if not is_path_in_any_dir(f.path, self.unity_dirs) or f.ext in (".s", ".S") or str(f) in unity_alone:
+                units.append({"src": str(f), "obj": obj, "cmd": self.compile_command(f, obj), "files": [f]})
+            else:
+                groups.setdefault((os.path.split(obj)[0], "c" if is_c else "cpp"), []).append(f)
 
-    for subpro in all_projs:
-        if not subpro.generate_executable:
-            continue
-        print(color.BOLD+"Linking Executable "+color.END+"for", rel_to_top(subpro.main_directory))
-
-        linker_string = ""
-        #region------CHECK LINKERSCRIPT TO USE-----
-        if subpro.found_linkersscripts:
-            #Check if info of which script to use is already in the cache
-            nocachefound = False
-            if subpro.main_directory in linkerscript_cache:
-                if linkerscript_cache[subpro.main_directory] == "X":
-                    i = 0
-                elif linkerscript_cache[subpro.main_directory] in subpro.found_linkersscripts:
-                    linker_string = "-T "+linkerscript_cache[subpro.main_directory]+" "
+        for (obj_dir, lang), files in groups.items():
+            files.sort(key=str)
+            symbols = {str(f) : file_scope_symbols(str(f)) for f in files}
+            seen = {}
+            for f in files:
+                for sym in symbols[str(f)]:
+                    seen[sym] = seen.get(sym, 0) + 1
+            batched = []
+            for f in files:
+                reason = unity_unsafe_reason(str(f))
+                if reason is None and any(seen[sym] > 1 for sym in symbols[str(f)]):
+                    reason = "it declares static symbols of the same name as another file"
+                if reason is not None:
+                    vprint("Compiling", rel_to_top(str(f)), "on its own,", reason)
+                    units.append({"src": str(f), "obj": self.get_obj_path(f), "cmd": self.compile_command(f, self.get_obj_path(f)), "files": [f]})
                 else:
-                    nocachefound = True
+                    batched.append(f)
+
+            #Greedily fill each batch with the files sharing the most headers with the ones already in it
+            headers = {str(f) : set(cache_dictionary.get(str(f), {}).get("I", [])) for f in batched}
+            while batched:
+                batch = [batched.pop(0)]
+                shared = set(headers[str(batch[0])])
+                while batched and len(batch) < self.unity_size:
+                    best = max(range(len(batched)), key=lambda k: (len(headers[str(batched[k])] & shared), -k))
+                    batch.append(batched.pop(best))
+                    shared |= headers[str(batch[-1])]
+                obj = os.path.join(obj_dir, unity_batch_name(batch, lang)+".o")
+
+                #Files that changed since the batch was compiled leave it for good, if there are others that didn't
+                if args.unity_changed_alone and args.incremental and os.path.exists(obj) and "M" in object_cache.get(obj, {}):
+                    changed = [f for f in batch if str(f) in object_cache[obj]["M"] and self.member_changed(f, obj)]
+                    if 0 < len(changed) < len(batch):
+                        for f in changed:
+                            vprint("Compiling", rel_to_top(str(f)), "on its own from now on, it changed since its unity batch was compiled")
+                            unity_alone.add(str(f))
+                            units.append({"src": str(f), "obj": self.get_obj_path(f), "cmd": self.compile_command(f, self.get_obj_path(f)), "files": [f]})
+                        batch = [f for f in batch if f not in changed]
+                        obj = os.path.join(obj_dir, unity_batch_name(batch, lang)+".o")
+
+                if len(batch) == 1:
+                    f = batch[0]
+                    units.append({"src": str(f), "obj": self.get_obj_path(f), "cmd": self.compile_command(f, self.get_obj_path(f)), "files": [f]})
+                    continue
+                unity_dir = os.path.join(build_dir, self.build_subdir, "unity", os.path.split(obj_dir)[1])
+                src = os.path.join(unity_dir, os.path.splitext(os.path.split(obj)[1])[0]+(".c" if lang == "c" else ".cpp"))
+                unity_sources.add(src)
+                content = "".join('#include "'+str(f)+'"\n' for f in batch)
+                units.append({"src": src, "obj": obj, "cmd": self.unity_command(batch, src, obj), "files": batch})
+                if content_differs(src, content):
+                    if args.explain: #The file isn't written, so its modification date can't tell
+                        units[-1]["reason"] = "the files in the unity batch changed"
+                    else:
+                        os.makedirs(unity_dir, exist_ok=True)
+                        with open(src, "w") as u:
+                            u.write(content)
+
+        #Generated files of batches that don't exist anymore
+        if not args.explain:
+            for root, dirs, fs in os.walk(os.path.join(build_dir, self.build_subdir, "unity")):
+                for u in fs:
+                    if os.path.join(root, u) not in unity_sources:
+                        os.unlink(os.path.join(root, u))
+        return units
+
+    #returns if the source file f of a unity batch changed since the batch was compiled into obj
+    def member_changed(self, f, obj) -> bool:
+        if args.content_hash:
+            return object_cache[obj]["M"][str(f)] != self.inputs_digest(f)
+        return self.input_change(f, os.path.getmtime(obj)) is not None
+
+    #returns self.pch_plan, planning it first if that didn't happen yet in this build
+    def get_pch_plan(self):
+        if self.pch_plan is None:
+            self.plan_pch()
+        return self.pch_plan
+
+    #Decides which headers to precompile, separately for C and C++ since they need different flags
+    #Those are the headers included with <> by at least half of the source files (and at least 2), that aren't files of the projects
+    #Only source files that include all of them use the precompiled header, so nothing gets included into a file that didn't ask for it
+    #Writes the header including them to build/<project>/pch/, and stores everything in self.pch_plan
+    def plan_pch(self):
+        self.pch_plan = {}
+        pch_dir = os.path.join(build_dir, self.build_subdir, "pch")
+        for lang, exts in (("c", self.srcC_fileendings - {".s", ".S"}), ("c++", self.srcCpp_fileendings)):
+            tus = [f for f in self.src_files.values() if f.ext in exts]
+            includes = {} #{source file : system headers it includes}
+            for f in tus:
+                project_headers = cache_dictionary.get(str(f), {}).get("I", [])
+                includes[str(f)] = [i for i in read_system_includes(str(f)) if not any(h.endswith(os.path.sep+i) for h in project_headers)]
+            counts = {}
+            for incl in includes.values():
+                for i in set(incl):
+                    counts[i] = counts.get(i, 0) + 1
+            common = {i for i, n in counts.items() if n >= 2 and n*2 >= len(tus)}
+            users = {f for f, incl in includes.items() if common and common <= set(incl)}
+            if len(users) < 2:
+                continue
+            #In the order the first user includes them
+            ordered = []
+            for i in includes[min(users)]:
+                if i in common and i not in ordered:
+                    ordered.append(i)
+
+            header = os.path.join(pch_dir, lang.replace("+", "p")+".h")
+            content = "".join("#include <"+i+">\n" for i in ordered)
+            header_changed = content_differs(header, content)
+            if header_changed and not args.explain:
+                os.makedirs(pch_dir, exist_ok=True)
+                with open(header, "w") as h:
+                    h.write(content)
+
+            comp = split_args(self.ccomp if lang == "c" else self.cppcomp)
+            if os.path.split(comp[0])[1] == "ccache": #ccache doesn't cache precompiled headers
+                comp = comp[1:]
+            output = header + (".pch" if "clang" in os.path.split(comp[0])[1] else ".gch")
+            flags = split_args(self.cflags if lang == "c" else self.cppflags)
+            cmd = comp + ["-x", lang+"-header", header, "-o", output, "-MD", "-MF", output+".d"] + flags
+            self.pch_plan[lang] = {"header": header, "output": output, "cmd": cmd, "users": users, "changed": header_changed}
+            vprint("Precompiling", len(ordered), "headers for", len(users), lang, "source files of", rel_to_top(self.main_directory))
+        return self.pch_plan
+
+    #returns a digest of the contents of f and all headers in its cached "I" list, used with --content-hash
+    def inputs_digest(self, f):
+        if str(f) not in cache_dictionary:
+            return None
+        h = hashlib.sha1(content_digest(str(f)).encode())
+        for i in cache_dictionary[str(f)].get("I", []):
+            h.update((content_digest(i) if os.path.exists(i) else "missing").encode())
+        return h.hexdigest()
+
+    #Checks if the object file of f is older than f or any header in its cached "I" list, or was compiled with another command
+    #With --content-hash, the contents of those files are compared against `digest` instead of the modification dates
+    #returns why obj needs to be compiled again, or None if it doesn't
+    def recompile_reason(self, f, obj, cmd, digest = None):
+        if not os.path.exists(obj):
+            return "the object file doesn't exist"
+        if obj not in object_cache:
+            return "the object file isn't in the cache"
+        if object_cache[obj]["C"] != shlex.join(cmd):
+            return "the compile command changed"
+        if args.content_hash:
+            if digest is None:
+                return "its includes aren't in the cache"
+            if object_cache[obj].get("H") != digest:
+                return "the content of "+rel_to_top(str(f))+" or a header it includes changed"
+            return None
+        return self.input_change(f, os.path.getmtime(obj))
+
+    #returns which of f and the headers in its cached "I" list was modified after the time t or doesn't exist anymore, or None
+    def input_change(self, f, t):
+        if f.modtime > t:
+            return rel_to_top(str(f))+" changed"
+        if str(f) not in cache_dictionary or "I" not in cache_dictionary[str(f)]:
+            return "the includes of "+rel_to_top(str(f))+" aren't in the cache"
+        for h in cache_dictionary[str(f)]["I"]:
+            if h in header_files:
+                h_time = header_files[h].modtime
+            elif tree.isfile(h):
+                h_time = tree.getmtime(h)
             else:
-                nocachefound = True
-            
-            if nocachefound:
-                print(interaction_required_string+"Linkerscript found!")
-                i = 0
-                for l in subpro.found_linkersscripts:
-                    print("("+rel_to_top(str(i))+") "+l)
-                    i+=1
-
-                inp = -1
-                while inp > len(subpro.found_linkersscripts)-1 or inp < 0:
-                    k = xinput("Press the precceding index for which Linkerscript to use, x for none\n")
-                    try:
-                        if k == 'x':
-                            break
-                        inp = int(k)
-                    except ValueError:
-                        inp = -1 
-                if k == 'x':
-                    print("Not using any")
-                    linkerscript_cache[subpro.main_directory] = "X"
-                else:
-                    linker_string = "-T "+subpro.found_linkersscripts[inp]+" "
-                    linkerscript_cache[subpro.main_directory] = subpro.found_linkersscripts[inp]
+                return rel_to_top(h)+" doesn't exist anymore"
+            if h_time > t:
+                return rel_to_top(h)+" changed"
+        return None
+
+    #returns why the unit u of compile_units() needs to be compiled (None if it doesn't), the digest of its inputs,
+    #and for unity batches the digests of its source files, both used with --content-hash
+    def unit_stale_reason(self, u):
+        obj, cmd, files = u["obj"], u["cmd"], u["files"]
+        if "reason" in u:
+            return u["reason"], None, None
+        members = None
+        if len(files) == 1:
+            digest = self.inputs_digest(files[0]) if args.content_hash else None
         else:
-            linkerscript_cache[subpro.main_directory] = "N"
-        #endregion
+            #A unity batch is outdated if its generated file or any of its source files changed
+            members = {str(f) : self.inputs_digest(f) if args.content_hash else None for f in files}
+            digest = None
+            if args.content_hash and None not in members.values():
+                digest = hashlib.sha1((content_digest(u["src"])+"".join(members.values())).encode()).hexdigest()
+        if not args.incremental:
+            return "all files are compiled without -i", digest, members
+        reason = self.recompile_reason(files[0], obj, cmd, digest)
+        if reason is None and len(files) > 1 and not args.content_hash:
+            obj_time = os.path.getmtime(obj)
+            if os.path.getmtime(u["src"]) > obj_time:
+                reason = "the files in the unity batch changed"
+            for f in files:
+                reason = reason or self.input_change(f, obj_time)
+        return reason, digest, members
+
+    #returns why the precompiled header of `plan` (see plan_pch()) needs to be built, or None if it is up to date
+    def pch_stale_reason(self, plan):
+        cached = pch_cache.get(plan["output"])
+        if plan["changed"]:
+            return "the headers to precompile changed"
+        if not os.path.exists(plan["output"]) or not cached:
+            return "it wasn't built yet"
+        if cached["F"] != link_fingerprint(shlex.join(plan["cmd"]), cached["D"]):
+            return "its command or a header it includes changed"
+        return None
+
+    #Deletes object files that aren't in `expected` (e.g. of sources that are no longer part of this project), and bundle folders of removed libraries
+    def prune_objects(self, expected):
+        lib_names = [os.path.split(L)[1] for L in self.lib_dirs]
+        proj_build_dir = os.path.join(build_dir, self.build_subdir)
+        for d in os.listdir(proj_build_dir):
+            if d not in ("non_prop", "obj", "lib", "pch", "unity", "rsp") and d not in lib_names:
+                vprint("Removing stale library folder", d)
+                shutil.rmtree(os.path.join(proj_build_dir, d), ignore_errors=True)
+        for a in os.listdir(os.path.join(proj_build_dir, "lib")):
+            if os.path.splitext(a)[0] not in lib_names:
+                os.unlink(os.path.join(proj_build_dir, "lib", a))
+                archive_cache.pop(os.path.join(proj_build_dir, "lib", a), None)
+        for d in ["non_prop", "obj"] + lib_names:
+            for o in os.listdir(os.path.join(proj_build_dir, d)):
+                obj = os.path.join(proj_build_dir, d, o)
+                if obj in expected:
+                    continue
+                vprint("Removing stale object file", obj)
+                os.unlink(obj)
+                object_cache.pop(obj, None)
 
-        all_os_locs_list = [] #List of folders to take all the .obj files out of
-        #Take non_propageted files only from the project that we are looking at right now
-        loc = os.path.join(build_dir, subpro.build_subdir, "non_prop")
-        if os.listdir(loc):
-            all_os_locs_list.append(loc)
+    #Adds the jobs compiling this project's object files and bundling its libraries to the JobServer `jobs`
+    #Returns the ids of all added jobs, so linking can wait for them
+    def compile(self, jobs):
+        print(color.BOLD+"Compiling Object-files"+color.END+ " for project", rel_to_top(self.main_directory))
 
-        mutual_os_locs_list = []
-        libs = "" #Libraries string 
+        #Returns False if the compiler failed, which stops the build
+        #For unity batches, `members` are the digests of their source files (or None without --content-hash)
+        def gen_o(src, obj, cmd, digest, members = None):
+            #This is multithreaded! But no writing to shared variables happens here (except for distinct keys in object_cache)
+            t = time.time()
+            with tracer.span("compile "+os.path.split(src)[1], "compile", file=src):
+                output = run_captured(cmd)
+            print_block(shlex.join(cmd) if args.print_commands else "", output.stdout)
+            if output.returncode == 0:
+                object_cache[obj] = {"C": shlex.join(cmd), "D": time.time()-t, "H": digest}
+                if members is not None:
+                    object_cache[obj]["M"] = members
+                return True
+            object_cache.pop(obj, None)
+            print_block(error_string+"Compiling "+rel_to_top(src)+" failed")
+            return False
 
-        #Add /obj, /lib Folders and precompiled filse of all relevant projects
-        subproj_real_subprojdirs = [os.path.realpath(x) for x in subpro.subproject_dirs]
-        for sd in all_projs:
+        #Builds a precompiled header planned by plan_pch(), and remembers the files it depends on to know when it is outdated
+        #Returns False if the compiler failed
+        def gen_pch(plan):
+            cmd = plan["cmd"]
+            pch_cache.pop(plan["output"], None)
+            with tracer.span("pch "+os.path.split(plan["header"])[1], "pch", project=rel_to_top(self.main_directory)):
+                output = run_captured(cmd)
+            print_block(color.BOLD+"Precompiling headers"+color.END+" "+rel_to_top(plan["header"]), shlex.join(cmd) if args.print_commands else "", output.stdout)
+            if output.returncode != 0:
+                print_block(error_string+"Precompiling "+rel_to_top(plan["header"])+" failed")
+                return False
+            with open(plan["output"]+".d") as d:
+                deps = split_make_rule(d.read())[1:]
+            pch_cache[plan["output"]] = {"F": link_fingerprint(shlex.join(cmd), deps), "D": deps}
+            return True
+
+        def bundle(name):
+            with tracer.span("ar "+name, "ar", project=rel_to_top(self.main_directory)):
+                return bundle_archive(name)
+
+        #Bundles the objects in the folder `name` into lib/name.a. If the archive was made by a previous run, only
+        #the members that changed are replaced (ar r) and the ones that were removed are deleted (ar d)
+        #Returns False if ar failed
+        def bundle_archive(name):
+            archive = os.path.join(build_dir,self.build_subdir,"lib", name+".a")
+            members = sorted(glob.glob(os.path.join(build_dir, self.build_subdir, name, "*")))
+            mode = "T" if args.thin_archives else ""
+            fingerprint = link_fingerprint(self.ar+" rc"+mode+" "+archive, members)
+            if os.path.exists(archive) and link_cache.get(archive) == fingerprint:
+                vprint("Up to date:", rel_to_top(archive))
+                return True
 
-            if sd.only_link_with_direct_parent and os.path.realpath(sd.main_directory) not in subproj_real_subprojdirs:
+            stamps = {m : file_stamp(m) for m in members}
+            previous = archive_cache.get(archive)
+            cmds = []
+            removed = [os.path.split(m)[1] for m in previous["M"] if m not in stamps] if previous else []
+            #Thin archives store their members as paths relative to the archive, so ar d can't find them by name.
+            #Rebuilding a thin archive is cheap, it only holds the paths
+            if previous is None or previous["T"] != args.thin_archives or not os.path.exists(archive) or (args.thin_archives and removed):
+                #Build it from scratch, ar would keep members that are gone from an existing archive
+                if os.path.exists(archive):
+                    os.unlink(archive)
+                cmds.append(split_args(self.ar) + ["rc"+mode, archive] + members)
+            else:
+                changed = [m for m in members if previous["M"].get(m) != stamps[m]]
+                if removed:
+                    cmds.append(split_args(self.ar) + ["d"+mode, archive] + removed)
+                if changed:
+                    cmds.append(split_args(self.ar) + ["rc"+mode, archive] + changed)
+
+            archive_cache.pop(archive, None)
+            link_cache.pop(archive, None)
+            lines = [color.BOLD+"Bundeling Libray"+color.END+" "+name]
+            for cmd in cmds:
+                output = run_captured(cmd)
+                lines.extend([shlex.join(cmd) if args.print_commands else "", output.stdout])
+                if output.returncode != 0:
+                    print_block(*lines, error_string+"Bundling library "+name+" failed")
+                    return False
+            print_block(*lines)
+            archive_cache[archive] = {"T": args.thin_archives, "M": stamps}
+            link_cache[archive] = fingerprint
+            return True
+
+        units = self.compile_units()
+        if args.incremental:
+            self.prune_objects({u["obj"] for u in units})
+
+        #Longest compile jobs first, files without a recorded duration are assumed to take an average time
+        durations = [o["D"] for o in object_cache.values() if "D" in o]
+        average_duration = sum(durations)/len(durations) if durations else 0
+        job_ids = []
+        lib_job_ids = {os.path.split(L)[1] : [] for L in self.lib_dirs} #compile jobs of the objects that go into each library
+
+        #Precompiled headers are built first if they are outdated, the source files using them wait for that and are compiled again
+        pch_jobs = {} #{path of source file : id of the job building its precompiled header}
+        if args.pch:
+            for plan in self.get_pch_plan().values():
+                if self.pch_stale_reason(plan) is None:
+                    vprint("Up to date:", rel_to_top(plan["output"]))
+                    continue
+                job_ids.append(jobs.add(lambda plan=plan: gen_pch(plan), float("inf")))
+                for u in plan["users"]:
+                    pch_jobs[u] = job_ids[-1]
+
+        for u in units:
+            obj, files = u["obj"], u["files"]
+            reason, digest, members = self.unit_stale_reason(u)
+            uses_pch = [pch_jobs[str(f)] for f in files if str(f) in pch_jobs]
+            if reason is None and not uses_pch:
+                vprint("Up to date:", rel_to_top(obj))
                 continue
-            
-            loc = os.path.join(build_dir, sd.build_subdir, "obj")
-            if os.listdir(loc):
-                mutual_os_locs_list.append(loc)
+            cost = object_cache[obj]["D"] if obj in object_cache and "D" in object_cache[obj] else average_duration
+            job_ids.append(jobs.add(lambda u=u, digest=digest, members=members: gen_o(u["src"], u["obj"], u["cmd"], digest, members), cost, uses_pch[:1]))
+            if files[0].compiled_to_lib_folder:
+                lib_job_ids[files[0].compiled_to_lib_folder].append(job_ids[-1])
+
+        #Bundle each declared library into a .a as soon as its objects are done
+        for name, deps in lib_job_ids.items():
+            job_ids.append(jobs.add(lambda name=name: bundle(name), float("inf"), deps))
+        return job_ids
+
+#Returns the projects whose objects and libraries are linked into the executable of subpro
+def linked_projects(subpro):
+    subproj_real_subprojdirs = [os.path.realpath(x) for x in subpro.subproject_dirs]
+    return [sd for sd in all_projs if not sd.only_link_with_direct_parent or os.path.realpath(sd.main_directory) in subproj_real_subprojdirs]
+
+#Asks the user which linkerscript to use for subpro (if there are any, and this wasn't cached), returns the linker arguments for it
+def choose_linkerscript(subpro):
+    linker_args = []
+    if subpro.found_linkersscripts:
+        #Check if info of which script to use is already in the cache
+        nocachefound = False
+        if subpro.main_directory in linkerscript_cache:
+            if linkerscript_cache[subpro.main_directory] == "X":
+                i = 0
+            elif linkerscript_cache[subpro.main_directory] in subpro.found_linkersscripts:
+                linker_args = ["-T", linkerscript_cache[subpro.main_directory]]
+            else:
+                nocachefound = True
+        else:
+            nocachefound = True
+        
+        if nocachefound:
+            print(interaction_required_string+"Linkerscript found!")
+            i = 0
+            for l in subpro.found_linkersscripts:
+                print("("+rel_to_top(str(i))+") "+l)
+                i+=1
+
+            inp = -1
+            while inp > len(subpro.found_linkersscripts)-1 or inp < 0:
+                k = xinput("Press the precceding index for which Linkerscript to use, x for none\n")
+                try:
+                    if k == 'x':
+                        break
+                    inp = int(k)
+                except ValueError:
+                    inp = -1 
+            if k == 'x':
+                print("Not using any")
+                linkerscript_cache[subpro.main_directory] = "X"
+            else:
+                linker_args = ["-T", subpro.found_linkersscripts[inp]]
+                linkerscript_cache[subpro.main_directory] = subpro.found_linkersscripts[inp]
+    else:
+        linkerscript_cache[subpro.main_directory] = "N"
+    return linker_args
+
+#returns the path of the executable the linker writes for subpro, as given by -o in its LINKERFLAGS
+def link_output(subpro):
+    flags = split_args(subpro.linkerflags)
+    output = "a.out"
+    for i in range(len(flags)):
+        if flags[i] == "-o" and i+1 < len(flags):
+            output = flags[i+1]
+        elif flags[i].startswith("-o") and len(flags[i]) > 2:
+            output = flags[i][2:]
+    return os.path.join(top_level_dir, output)
+
+#Returns False if the linker failed
+def link(subpro, linker_args):
+    s_t = time.time()    
 
-            for L in os.listdir(os.path.join(build_dir, sd.build_subdir, "lib")):
-                libs += os.path.join(build_dir, sd.build_subdir, "lib", os.path.split(L)[1])+" "
-            
-            libs += sd.public_precomps+" "
+    all_os_locs_list = [] #List of folders to take all the .obj files out of
+    #Take non_propageted files only from the project that we are looking at right now
+    loc = os.path.join(build_dir, subpro.build_subdir, "non_prop")
+    if os.listdir(loc):
+        all_os_locs_list.append(loc)
 
-            #linker_string += " " + (" ".join(sd.linkerflags))
-        
-        all_os_locs_list.extend(mutual_os_locs_list)
+    mutual_os_locs_list = []
+    libs = [] #Libraries and precompiled files
+
+    #Add /obj, /lib Folders and precompiled filse of all relevant projects
+    for sd in linked_projects(subpro):
+        loc = os.path.join(build_dir, sd.build_subdir, "obj")
+        if os.listdir(loc):
+            mutual_os_locs_list.append(loc)
 
-        all_os = "" #String from list
-        for o in all_os_locs_list:
-            all_os += o + os.path.sep + "* "
+        for L in os.listdir(os.path.join(build_dir, sd.build_subdir, "lib")):
+            libs.append(os.path.join(build_dir, sd.build_subdir, "lib", os.path.split(L)[1]))
+        
+        libs.extend(sd.public_precomps)
+
+        #linker_args += " " + (" ".join(sd.linkerflags))
+    
+    all_os_locs_list.extend(mutual_os_locs_list)
+
+    all_os = [] #object files of all those folders
+    for o in all_os_locs_list:
+        all_os.extend(sorted(glob.glob(os.path.join(o, "*"))))
+
+    precomps = libs + subpro.private_precomps
+    cmd = split_args(subpro.linker) + all_os + precomps + linker_args + split_args(subpro.linkerflags)
+
+    #Skip linking if neither the command nor any object, library, precompiled file or linkerscript changed since the last time
+    inputs = all_os + precomps
+    if linker_args:
+        inputs.append(linkerscript_cache[subpro.main_directory])
+    output = link_output(subpro)
+    fingerprint = link_fingerprint(shlex.join(cmd), inputs)
+    if os.path.exists(output) and link_cache.get(output) == fingerprint:
+        vprint("Up to date:", rel_to_top(output))
+        return True
+
+    with tracer.span("link "+os.path.split(output)[1], "link", project=rel_to_top(subpro.main_directory)):
+        result = run_captured(cmd)
+    print_block(color.BOLD+"Linking Executable "+color.END+"for "+rel_to_top(subpro.main_directory), shlex.join(cmd) if args.print_commands else "", result.stdout)
+    if result.returncode != 0:
+        link_cache.pop(output, None)
+        print_block(error_string+"Linking "+rel_to_top(output)+" failed")
+        return False
+    link_cache[output] = fingerprint
+    vprint("Linked", rel_to_top(subpro.main_directory), "in",time.time()-s_t,"s")
+    return True
+
+#Compiles the object files of all projects in one pool of workers, libraries are bundled and executables linked
+#as soon as everything they need is done
+#Stops starting new jobs after the first one failed, and returns False then
+def build():
+    s_t = time.time()
+    jobs = JobServer(args.thread_num)
+    project_job_ids = {}
+    for p in all_projs:
+        project_job_ids[p] = p.compile(jobs)
 
-        precomp_string = libs + subpro.private_precomps
-        cmd = subpro.linker+" "+all_os+precomp_string+linker_string+(" ".join(subpro.linkerflags))
-        if args.print_commands:
-            print(cmd)
-        subprocess.run(cmd, shell=True)
-        vprint("Done in",time.time()-s_t,"s")
+    #Remove build folders of projects that aren't part of this build anymore
+    if args.incremental:
+        for d in os.listdir(build_dir):
+            if os.path.isdir(os.path.join(build_dir, d)) and d not in used_build_subdirs:
+                vprint("Removing stale project build folder", d)
+                shutil.rmtree(os.path.join(build_dir, d))
 
-    #Write Cache
+    for p in all_projs:
+        if not p.generate_executable:
+            continue
+        linker_args = choose_linkerscript(p)
+        deps = []
+        for sd in linked_projects(p):
+            deps.extend(project_job_ids[sd])
+        jobs.add(lambda p=p, linker_args=linker_args: link(p, linker_args), float("inf"), deps)
+
+    if not jobs.run():
+        print(error_string+"Build failed")
+        return False
+    vprint("Build done in",time.time()-s_t,"s")
+    return True
+
+def write_cache():
     cache_dictionary["NEEDED_SRC_FILES_SUBCACHE"] = needed_src
     cache_dictionary["SUBPROJ"] = subproject_usage_cache
     cache_dictionary["LINKERSCRIPT_TO_USE"] = linkerscript_cache
-    output_file_name = os.path.join(build_dir,"comp_cache")
-    with open(output_file_name, "w") as toml_file:
-        toml.dump(cache_dictionary, toml_file)
+    cache_dictionary["OBJECTS"] = object_cache
+    cache_dictionary["CONTENT_HASHES"] = content_hashes
+    cache_dictionary["LINKS"] = link_cache
+    cache_dictionary["ARCHIVES"] = archive_cache
+    cache_dictionary["PCH"] = pch_cache
+    cache_dictionary["UNITY_ALONE"] = sorted(unity_alone)
+    cache_dictionary["TOOLS"] = tool_probes
+    #Only the include directory sets some file still refers to are kept
+    used = {v["S"] for v in cache_dictionary.values() if type(v) == dict and type(v.get("S")) == int}
+    cache_dictionary["INCLUDE_SETS"] = {str(i) : list(include_sets_by_id[i]) for i in sorted(used)}
+    save_cache(cache_store, cache_dictionary)
 
     vprint("Total time",time.time()-t0,"s")
 
+#Writes the --trace file and prints the translation units and headers that took the longest to compile in this build
+#The cost of a header is the compile time of all translation units that include it
+def write_trace(top = 10):
+    tracer.write(args.trace)
+    tus = tracer.durations("compile", "file")
+    headers = {}
+    for src, d in tus:
+        for h in cache_dictionary.get(src, {}).get("I", []):
+            headers[h] = headers.get(h, 0) + d
+    print(color.BOLD+"Slowest translation units"+color.END)
+    for src, d in sorted(tus, key=lambda x: -x[1])[:top]:
+        print("\t"+str(round(d, 3))+"s", rel_to_top(src))
+    print(color.BOLD+"Most expensive headers"+color.END, "(compile time of the translation units including them)")
+    for h, d in sorted(headers.items(), key=lambda x: -x[1])[:top]:
+        print("\t"+str(round(d, 3))+"s", rel_to_top(h))
+    print("Trace written to", args.trace)
+
+#Prints which translation units a build would compile and why, and why files had their includes searched again with
+#the preprocessor calls that took. With a file given to --explain, this is written to it as JSON instead
+def explain():
+    rebuild = [] #[{"unit", "object", "files", "reason", "command"}]
+    for p in all_projs:
+        pch_reasons = {} #{path of source file : why it is compiled again because of its precompiled header}
+        if args.pch:
+            for plan in p.get_pch_plan().values():
+                reason = p.pch_stale_reason(plan)
+                if reason is not None:
+                    rebuild.append({"unit": plan["header"], "object": plan["output"], "files": [], "reason": reason, "command": shlex.join(plan["cmd"])})
+                    for u in plan["users"]:
+                        pch_reasons[u] = "its precompiled header "+rel_to_top(plan["output"])+" is built again"
+        for u in p.compile_units():
+            reason = p.unit_stale_reason(u)[0]
+            for f in u["files"]:
+                reason = reason or pch_reasons.get(str(f))
+            if reason is not None:
+                rebuild.append({"unit": u["src"], "object": u["obj"], "files": [str(f) for f in u["files"]], "reason": reason, "command": shlex.join(u["cmd"])})
+    searched = [{"file": path, "reason": reason, "preprocessor": prepro_calls.get(path, [])} for path, reason in search_reasons.items()]
+    generated = [{"file": out, "command": shlex.join(cmd)} for p in all_projs for out, cmd in p.stale_qt_outputs]
+
+    if args.explain != "-":
+        with open(args.explain, "w") as f:
+            json.dump({"cache_cleared_because": cache_cleared_because, "generate": generated, "rebuild": rebuild, "searched": searched}, f, indent=1)
+        print("Explanation written to", args.explain)
+        return
+    if cache_cleared_because:
+        print(warning_string+"The cache was discarded because", cache_cleared_because)
+    if generated:
+        print(color.BOLD+"Would generate"+color.END, len(generated), "outdated uic/moc files, the search used the outdated ones")
+        for g in generated:
+            print("\t"+rel_to_top(g["file"])+":", g["command"])
+    print(color.BOLD+"Includes searched again"+color.END, "for", len(searched), "files")
+    for s in searched:
+        print("\t"+rel_to_top(s["file"])+":", s["reason"])
+        for cmd in s["preprocessor"]:
+            print("\t\t"+cmd)
+    print(color.BOLD+"Would compile"+color.END, len(rebuild), "translation units")
+    for r in rebuild:
+        print("\t"+rel_to_top(r["unit"])+":", r["reason"])
+        if len(r["files"]) > 1:
+            for f in r["files"]:
+                print("\t\t"+rel_to_top(f))
+
+#Writes the compile command of every source file of all projects to build/compile_commands.json
+#Entries of other files already in there are removed, the file is only written if an entry changed
+def write_compdb():
+    path = os.path.join(build_dir, "compile_commands.json")
+    old = []
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                old = json.load(f)
+        except ValueError:
+            old = [] #damaged, write it anew
+    entries = []
+    for p in all_projs:
+        for f in p.src_files.values():
+            obj = p.get_obj_path(f)
+            cmd = p.compile_command(f, obj, rsp = False)
+            if os.path.split(cmd[0])[1] == "ccache": #tools reading the database want the compiler itself
+                cmd = cmd[1:]
+            entries.append({"directory": top_level_dir, "arguments": cmd, "file": str(f), "output": obj})
+    entries.sort(key=lambda e: e["file"])
+    if entries == old:
+        vprint("compile_commands.json is up to date")
+        return
+    old_keys = {json.dumps(e, sort_keys=True) for e in old}
+    changed = sum(1 for e in entries if json.dumps(e, sort_keys=True) not in old_keys)
+    with open(path+".tmp", "w") as f:
+        json.dump(entries, f, indent=1)
+    os.replace(path+".tmp", path)
+    vprint("Updated", changed, "entries in", rel_to_top(path))
+
+#Keeps all projects in memory and rebuilds whenever a file below the top level directory changes
+#Only the source files that are or include a changed file are searched again, the build is incremental anyway
+#Files being added or removed and changed config files alter the structure of the projects, then comp4me is started anew
+def watch():
+    global tree, dirty_files
+    endings = {".ui"}
+    for p in all_projs:
+        endings |= p.allowed_fileendings | p.precompiled_fileendings | p.linkerscript_fileendings
+    def relevant(path):
+        return os.path.splitext(path)[1] in endings or comp_reg.match(os.path.split(path)[1])
+
+    watcher = TreeWatcher(top_level_dir)
+    restart_needed = False #a rebuild failed, so the projects in memory might be only half updated
+    print(color.BOLD+"Watching for changes"+color.END+", press Ctrl-C to stop")
+    while True:
+        changed, added, removed = watcher.wait()
+        changed = {f for f in changed if relevant(f)}
+        added = {f for f in added if relevant(f)}
+        removed = {f for f in removed if relevant(f)}
+        if not changed and not added and not removed:
+            continue
+        tree = watcher.tree
+
+        #uic and moc run again for QT5_MAKE folders with changed files, their output is part of this rebuild
+        for p in all_projs:
+            for d in p.qt5_dirs:
+                if any(os.path.split(f)[0] == d for f in changed):
+                    qt5_make(d, p.header_fileendings, False, tree)
+                    qt_changed, qt_added, qt_removed = watcher.update_dir(d)
+                    changed |= qt_changed
+                    added |= qt_added
+                    removed |= qt_removed
+
+        if restart_needed or added or removed or any(comp_reg.match(os.path.split(f)[1]) for f in changed):
+            print("Project structure changed, starting anew")
+            #The cache was just written, deleting it again would make this a full build
+            argv = [a for a in sys.argv if a not in ("-C", "--no-cache")]
+            os.execv(sys.executable, [sys.executable] + argv)
+
+        s_t = time.time()
+        vprint("Changed:", *[rel_to_top(f) for f in changed])
+        for p in all_projs:
+            for f in p.src_files.values():
+                if str(f) in changed:
+                    f.modtime = tree.getmtime(str(f))
+        for path, f in header_files.items():
+            if path in changed:
+                f.modtime = tree.getmtime(path)
+
+        dirty_files = dep_graph.with_dependents(changed)
+        tracer.clear()
+        for p in all_projs:
+            p.pch_plan = None #planned again with the includes of this rebuild
+        try:
+            for p in all_projs:
+                affected = [f for f in p.src_files.values() if str(f) in dirty_files or str(f) not in cache_dictionary]
+                if affected:
+                    p.search(src_additions = affected)
+            if args.compdb:
+                write_compdb()
+            with tracer.span("build", "build"):
+                build_ok = build()
+            write_cache()
+            if args.trace:
+                write_trace()
+            if not build_ok:
+                print(color.BOLD+"Watching for changes"+color.END+", press Ctrl-C to stop")
+                continue
+        except SystemExit:
+            if aborting:
+                raise
+            restart_needed = True
+            print(warning_string+"Rebuild failed, starting anew after the next change")
+            print(color.BOLD+"Watching for changes"+color.END+", press Ctrl-C to stop")
+            continue
+        print("Rebuilt in", round(time.time()-s_t, 3), "s")
+        print(color.BOLD+"Watching for changes"+color.END+", press Ctrl-C to stop")
+
 if os.path.exists(default_config_path):
     default_config_definitions = read_definitions(default_config_path)
 if not default_config_definitions:
@@ -1442,7 +2361,7 @@ if not os.path.exists(os.path.join(top_level_dir, top_level_config_file)):
     print("Needed config-file", args.config,"not found.")
     #Find all comp.toml files
     comp_match = []
-    for f in os.listdir(top_level_dir):
+    for f in tree.listdir(top_level_dir):
         comp_match.extend(comp_reg.findall(f))
     if comp_match == []:
         print("No config file found for project top-Level project, using defaults")
@@ -1460,25 +2379,23 @@ if not os.path.exists(os.path.join(top_level_dir, top_level_config_file)):
                 inp = -1  
         top_level_config_file = comp_match[inp]
 
-top_level = Project(is_top_level=True, ftu=top_level_config_file)
+with tracer.span("configure .", "config"):
+    top_level = Project(is_top_level=True, ftu=top_level_config_file)
 all_projs.append(top_level)
 all_proj_dirs_with_links.append(top_level.main_directory)
 
-top_level.presort() #Presort finds subprojects, adds them to all_projs, and calls presort() on them
+with tracer.span("presort .", "presort"):
+    top_level.presort() #Presort finds subprojects, adds them to all_projs, and calls presort() on them
 
 if args.print_structure:
-    tmp_en = []
-    tmp_n = []
-    tmp_ex = []
+    tmp_en = PathSet()
+    tmp_n = PathSet()
+    tmp_ex = PathSet()
     for p in all_projs:
         tmp_en.extend(p.entries)
         tmp_n.extend(p.manual_neutrals)
         tmp_ex.extend(p.excludes)
-    for root, dirs, files in os.walk(top_level.main_directory, topdown=True, followlinks=True):
-        ##Ignore hidden folders and build
-        if is_irrelevant(root):
-            continue
-        
+    for root, dirs, files in tree.walk(top_level.main_directory): #skips hidden folders and build
         offset = "-" * (root.count(os.path.sep)-top_level.main_directory.count(os.path.sep))
         if root in tmp_n:
             print(color.END,offset+root)
@@ -1495,14 +2412,32 @@ if args.print_structure:
             print(color.END,offset+root,color.END)
     print(color.END)
         
+if args.content_hash:
+    prehash_changed_files()
+
 print(color.BOLD+"Starting iterative search"+color.END)
 for p in all_projs:
-    p.search()
+    with tracer.span("search "+rel_to_top(p.main_directory), "search"):
+        p.search()
 
-for p in all_projs:
-    p.compile()
+if args.explain:
+    explain()
+    exit()
+if args.compdb:
+    write_compdb()
+if args.compdb_only:
+    write_cache()
+    exit()
 
-link()
+with tracer.span("build", "build"):
+    build_ok = build()
+write_cache() #also if the build failed, so the objects that were compiled are kept
+if args.trace:
+    write_trace()
 
 vprint("Time spent waiting for preprocessor:",procTime,"s")
+if args.watch:
+    watch()
+if not build_ok:
+    exit(1)
 exit()